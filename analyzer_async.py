@@ -1,34 +1,48 @@
-import os
+import time
 import asyncio
 import logging
-import csv
-import emoji
 from models.sentiment import SentimentAnalyzer
-from models.summarization import Summarizer
+from models.summarization import Summarizer, MAX_INPUT_TOKENS
+from models.extractive import ExtractiveSelector
+from models.manager import model_manager
+from storage import ReviewStore
+from parser_async import WildberriesParser
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    filename="analyzer.log",
-    filemode="a",
-    encoding="utf-8"
-)
 logger = logging.getLogger(__name__)
 
+# Ключи категорий в данных парсера и их названия в отчете
+CATEGORY_NAMES = {
+    "advantages": "Достоинства",
+    "disadvantages": "Недостатки",
+    "comments": "Комментарий"
+}
+
+# Предложения для прогрева моделей: типичные отзывы разной длины и структуры
+WARMUP_SENTENCES = [
+    "Хорошее качество, удобный и красивый дизайн.",
+    "Размер 46-48, рост 176 см - село идеально!",
+    "Ткань тонкая, после стирки села на 2 размера.",
+    "Пришло быстро, упаковка целая, продавцу спасибо.",
+    "Высокая цена и долгая доставка, но в целом доволен покупкой.",
+]
+
 class Analyzer:
     def __init__(self):
         self.sentiment_analyzer = SentimentAnalyzer()
         self.summarizer = Summarizer()
+        self.selector = ExtractiveSelector()
         self.data_dir = "data"
-        os.makedirs(self.data_dir, exist_ok=True)
+        self.store = ReviewStore(self.data_dir)
     
-    async def analyze_reviews_data_async(self, reviews_data):
+    async def analyze_reviews_data_async(self, reviews_data, deadline=None):
         """
         Анализ данных отзывов: сентимент-анализ и суммаризация
         
         Args:
             reviews_data (dict): Данные отзывов
+            deadline (Deadline): Крайний срок; при нехватке времени суммаризация
+                упрощается или пропускается, тональность считается всегда
             
         Returns:
             tuple: (путь к CSV-файлу, список проанализированных данных)
@@ -37,10 +51,8 @@ class Analyzer:
             article_id = reviews_data.get("article_id", "unknown")
             product_name = reviews_data.get("product_name", "Неизвестный товар")
             avg_rating = reviews_data.get("avg_rating", 0.0)
-            
-            # Создаем или открываем CSV-файл
-            csv_path = os.path.join(self.data_dir, f"reviews_data_{article_id}.csv")
-            file_exists = os.path.isfile(csv_path)
+            review_counts = reviews_data.get("review_counts", {})
+            clusters = reviews_data.get("clusters", {})
             
             analyzed_data = []
             
@@ -50,7 +62,10 @@ class Analyzer:
                     reviews_data["advantages"], 
                     "Достоинства", 
                     article_id, 
-                    avg_rating
+                    avg_rating,
+                    review_counts.get("advantages", 1),
+                    clusters.get("advantages"),
+                    deadline
                 )
                 analyzed_data.append(advantages_data)
             
@@ -60,7 +75,10 @@ class Analyzer:
                     reviews_data["disadvantages"], 
                     "Недостатки", 
                     article_id, 
-                    avg_rating
+                    avg_rating,
+                    review_counts.get("disadvantages", 1),
+                    clusters.get("disadvantages"),
+                    deadline
                 )
                 analyzed_data.append(disadvantages_data)
             
@@ -70,44 +88,18 @@ class Analyzer:
                     reviews_data["comments"], 
                     "Комментарий", 
                     article_id, 
-                    avg_rating
+                    avg_rating,
+                    review_counts.get("comments", 1),
+                    clusters.get("comments"),
+                    deadline
                 )
                 analyzed_data.append(comments_data)
             
             # Записываем данные в CSV
-            with open(csv_path, mode='a' if file_exists else 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file, delimiter=';')
-                
-                # Записываем заголовок, если файл новый
-                if not file_exists:
-                    writer.writerow([
-                        "№", "Артикул", "Средняя оценка", "Тип отзыва", 
-                        "Исходный отзыв", "Оценка", "Уровень уверенности", 
-                        "Автосуммаризация", "Эталон"
-                    ])
-                
-                # Определяем номер строки
-                row_num = 1
-                if file_exists:
-                    with open(csv_path, 'r', encoding='utf-8') as f:
-                        row_num = sum(1 for _ in f) - 1  # Вычитаем заголовок
-                
-                # Записываем данные
-                for data in analyzed_data:
-                    writer.writerow([
-                        row_num,
-                        article_id,
-                        avg_rating,
-                        data["category"],
-                        data["text"],
-                        data["sentiment"],
-                        data["confidence"],
-                        data["summary"],
-                        ""  # Эталон (пустой)
-                    ])
-                    row_num += 1
+            csv_path = self.store.append(article_id, avg_rating, analyzed_data, reviews_data.get("reviews_key"))
             
-            await Summarizer.release_model()
+            # Модели остаются в памяти, выгрузкой по простою и бюджету занимается менеджер
+            logger.info(f"Память моделей: {model_manager.report()}")
 
             return csv_path, analyzed_data
             
@@ -115,7 +107,162 @@ class Analyzer:
             logger.error(f"Ошибка при анализе отзывов: {e}")
             return None, []
     
-    async def _analyze_category(self, text, category, article_id, avg_rating):
+    async def replay_async(self, article_or_url, max_age=None):
+        """
+        Повторный анализ по сохраненным сырым данным, без браузера и сети
+        
+        Args:
+            article_or_url (str): Артикул или ссылка на товар
+            max_age (float): Максимальный возраст сырых данных в секундах
+            
+        Returns:
+            tuple: (путь к CSV-файлу, список проанализированных данных)
+        """
+        reviews_data = await WildberriesParser().replay(article_or_url, max_age=max_age)
+        if not reviews_data:
+            return None, []
+        return await self.analyze_reviews_data_async(reviews_data)
+    
+    async def analyze_many_async(self, reviews_batch, deadline=None):
+        """
+        Анализ нескольких товаров с общими пакетами инференса
+        
+        Args:
+            reviews_batch (list): Данные отзывов нескольких товаров
+            deadline (Deadline): Крайний срок анализа
+            
+        Returns:
+            list: Пары (путь к CSV-файлу, список проанализированных данных) в порядке товаров
+        """
+        results = self.analyze_batch(reviews_batch, deadline)
+        
+        paths = []
+        for reviews_data, analyzed_data in zip(reviews_batch, results):
+            paths.append(self.store.append(
+                reviews_data.get("article_id", "unknown"), reviews_data.get("avg_rating", 0.0), analyzed_data,
+                reviews_data.get("reviews_key")
+            ))
+        logger.info(f"Память моделей: {model_manager.report()}")
+        
+        return list(zip(paths, results))
+    
+    def warm_up(self):
+        """
+        Прогрев моделей на входах типичных размеров
+        
+        Первый прогон платит за загрузку весов, выделение памяти и выбор ядер вычислений,
+        поэтому его выполняем при старте процесса, а не на запросе пользователя.
+        
+        Returns:
+            float: Время прогрева в секундах
+        """
+        started = time.monotonic()
+        reviews_batch = []
+        # Короткий отзыв, средний и близкий к бюджету модели
+        for repeats in (1, 8, 40):
+            clusters = [{"text": sentence, "count": 1} for sentence in WARMUP_SENTENCES * repeats][:repeats * 3]
+            text = " ".join(cluster["text"] for cluster in clusters)
+            reviews_batch.append({
+                "article_id": "warmup",
+                **{key: text for key in CATEGORY_NAMES},
+                "clusters": {key: clusters for key in CATEGORY_NAMES},
+                "review_counts": {key: len(clusters) for key in CATEGORY_NAMES}
+            })
+        try:
+            self.analyze_batch(reviews_batch)
+        except Exception as e:
+            logger.error(f"Ошибка при прогреве моделей: {e}")
+        elapsed = time.monotonic() - started
+        logger.info(f"Прогрев моделей занял {elapsed:.1f} с")
+        return elapsed
+    
+    def analyze_batch(self, reviews_batch, deadline=None):
+        """
+        Синхронный пакетный анализ нескольких товаров за один прогон моделей
+        
+        Args:
+            reviews_batch (list): Данные отзывов нескольких товаров
+            deadline (Deadline): Крайний срок; при нехватке времени суммаризация
+                упрощается или пропускается
+            
+        Returns:
+            list: Списки проанализированных данных в порядке входных товаров
+        """
+        # Считаем токены всех предложений пакета одним вызовом, дальше отбор берет их из кеша
+        self._count_tokens([
+            sentence
+            for reviews_data in reviews_batch
+            for category_clusters in reviews_data.get("clusters", {}).values()
+            for sentence in self.selector.split_sentences(category_clusters)[0]
+        ])
+        
+        items = []
+        for idx, reviews_data in enumerate(reviews_batch):
+            review_counts = reviews_data.get("review_counts", {})
+            clusters = reviews_data.get("clusters", {})
+            for key, category in CATEGORY_NAMES.items():
+                text = reviews_data.get(key)
+                if not text:
+                    continue
+                items.append({
+                    "index": idx,
+                    "category": category,
+                    "text": text,
+                    "model_text": self._select_text(text, category, clusters.get(key)),
+                    "reviews_count": review_counts.get(key, 1)
+                })
+        
+        model_texts = [item["model_text"] for item in items]
+        fields = [item["category"] for item in items]
+        sentiments = self.sentiment_analyzer.analyze_batch(model_texts)
+        profile = self._summary_profile(deadline, fields)
+        summaries = self.summarizer.summarize_batch(model_texts, fields, profile=profile) if profile else [""] * len(items)
+        
+        results = [[] for _ in reviews_batch]
+        for item, (sentiment, confidence), summary in zip(items, sentiments, summaries):
+            results[item["index"]].append({
+                "category": item["category"],
+                "text": item["text"],
+                "sentiment": sentiment,
+                "confidence": confidence,
+                "summary": summary,
+                "reviews_count": item["reviews_count"]
+            })
+        return results
+    
+    def _summary_profile(self, deadline, fields):
+        """Профиль суммаризации, успевающий к сроку (None - только тональность)"""
+        if deadline is None:
+            return "full"
+        profile = self.summarizer.choose_profile(deadline.remaining(), fields)
+        if profile != "full":
+            logger.warning(
+                f"До срока {deadline.remaining():.1f} с, суммаризация "
+                f"{'в профиле ' + profile if profile else 'пропущена'}"
+            )
+        return profile
+
+    def _count_tokens(self, sentences):
+        """Длина предложений в токенах по более требовательному из токенизаторов"""
+        return [
+            max(sentiment_len, summary_len)
+            for sentiment_len, summary_len in zip(
+                self.sentiment_analyzer.count_tokens(sentences),
+                self.summarizer.count_tokens(sentences)
+            )
+        ]
+
+    def _select_text(self, text, category, clusters):
+        """Отбор представительных предложений вместо обрезки по началу текста"""
+        if not clusters:
+            return text
+        # Запас на служебные токены и склейку предложений
+        budget = min(self.summarizer.input_budget(category), MAX_INPUT_TOKENS - 2) - 8
+        selected = self.selector.select(clusters, budget, self._count_tokens)
+        return selected or text
+
+    async def _analyze_category(self, text, category, article_id, avg_rating, reviews_count=1, clusters=None,
+                                deadline=None):
         """
         Анализ категории отзывов
         
@@ -124,26 +271,35 @@ class Analyzer:
             category (str): Категория (Достоинства, Недостатки, Комментарий)
             article_id (str): Артикул товара
             avg_rating (float): Средняя оценка
+            reviews_count (int): Количество исходных отзывов с учетом дубликатов
+            clusters (list): Кластеры отзывов категории для экстрактивного отбора
+            deadline (Deadline): Крайний срок запроса
             
         Returns:
             dict: Результаты анализа
         """
+        # Точка отмены между вызовами моделей: устаревший запрос прерывается здесь
+        await asyncio.sleep(0)
+        
         try:
-            # Удаляем эмодзи
-            clean_text = emoji.replace_emoji(text, replace='')
+            # Текст уже нормализован парсером (эмодзи, пробелы, дубликаты),
+            # в модели передаем только отобранные под бюджет предложения
+            model_text = self._select_text(text, category, clusters)
             
             # Сентимент-анализ
-            sentiment, confidence = await self.sentiment_analyzer.analyze(clean_text)
+            sentiment, confidence = await self.sentiment_analyzer.analyze(model_text)
             
-            # Суммаризация
-            summary = await self.summarizer.summarize(clean_text, category)
+            # Суммаризация: профиль выбирается по оставшемуся времени
+            profile = self._summary_profile(deadline, [category])
+            summary = await self.summarizer.summarize(model_text, category, profile) if profile else ""
             
             return {
                 "category": category,
-                "text": clean_text,
+                "text": text,
                 "sentiment": sentiment,
                 "confidence": confidence,
-                "summary": summary
+                "summary": summary,
+                "reviews_count": reviews_count
             }
         except Exception as e:
             logger.error(f"Ошибка при анализе категории {category}: {e}")
@@ -152,7 +308,8 @@ class Analyzer:
                 "text": text,
                 "sentiment": "нейтральная",
                 "confidence": 0,
-                "summary": "Не удалось сформировать описание."
+                "summary": "Не удалось сформировать описание.",
+                "reviews_count": reviews_count
             }
 
 # Для тестирования
@@ -177,4 +334,6 @@ async def main():
         print()
 
 if __name__ == "__main__":
+    from log_setup import setup_logging
+    setup_logging("analyzer.log")
     asyncio.run(main())
@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from parser_async import WildberriesParser
+from storage import ReviewStore
+from capture_cache import CaptureCache
+from log_setup import setup_logging, setup_worker_logging, log_queue, request_id
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Анализатор внутри процесса-обработчика пула
+_worker_analyzer = None
+
+# Оценка памяти процесса инференса с обеими моделями в МБ
+WORKER_MODELS_MB = 3300
+
+
+def default_workers():
+    """
+    Количество процессов инференса по умолчанию
+
+    Каждый процесс держит свои копии моделей, поэтому процессов не больше,
+    чем ядер и чем помещается в половину физической памяти. На процесс
+    отводится MODEL_MEMORY_BUDGET_MB, если он задан, иначе оценка объема моделей.
+    """
+    cores = os.cpu_count() or 1
+    budget_mb = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+    per_worker_mb = min(budget_mb, WORKER_MODELS_MB) if budget_mb else WORKER_MODELS_MB
+    try:
+        total_mb = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20
+    except (AttributeError, ValueError, OSError):
+        # Объем памяти неизвестен: не рискуем больше чем двумя копиями моделей
+        return min(cores, 2)
+    return max(1, min(cores, total_mb // 2 // per_worker_mb))
+
+
+def _init_worker(workers, queue):
+    """Настройка логов, потоков и прогрев моделей один раз на процесс пула"""
+    global _worker_analyzer
+    setup_worker_logging(queue)
+    from models.runtime import configure_threads
+    from analyzer_async import Analyzer
+
+    # Каждый процесс получает свою долю ядер, чтобы не было переподписки
+    configure_threads(workers)
+    _worker_analyzer = Analyzer()
+    _worker_analyzer.warm_up()
+
+
+def _analyze_in_worker(reviews_batch):
+    """Пакетный анализ в процессе пула"""
+    return _worker_analyzer.analyze_batch(reviews_batch)
+
+
+class Checkpoint:
+    """Журнал обработанных артикулов для возобновления прерванного запуска"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Недописанная строка после аварийной остановки
+                    if record.get("status") == "done":
+                        self.done.add(record["article_id"])
+
+    def mark(self, article_id, status):
+        """Запись результата обработки артикула"""
+        if status == "done":
+            self.done.add(article_id)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"article_id": article_id, "status": status, "ts": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class BatchRunner:
+    """Массовый анализ артикулов: параллельный парсинг и пакетный инференс"""
+
+    def __init__(self, articles, checkpoint_path, parse_concurrency=4,
+                 workers=None, batch_size=16, data_dir="data", replay=False, reextract=False):
+        """
+        Args:
+            articles (list): Артикулы или ссылки на товары
+            checkpoint_path (str): Путь к журналу прогресса
+            parse_concurrency (int): Максимум одновременно открытых браузеров
+            workers (int): Количество процессов инференса (по умолчанию по ядрам и памяти, см. default_workers)
+            batch_size (int): Количество товаров в одном пакете инференса
+            data_dir (str): Директория хранилища результатов
+            replay (bool): Брать отзывы из кеша сырых данных вместо парсинга
+            reextract (bool): При replay извлекать отзывы заново из сохраненного HTML
+        """
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.articles = [a for a in articles if a not in self.checkpoint.done]
+        self.skipped = len(articles) - len(self.articles)
+        self.parse_concurrency = parse_concurrency
+        self.batch_size = batch_size
+        self.store = ReviewStore(data_dir)
+        self.captures_dir = os.path.join(data_dir, "captures")
+        self.replay = replay
+        self.reextract = reextract
+
+        self.workers = workers or default_workers()
+
+        self.processed = 0
+        self.failed = 0
+        self.started_at = None
+
+    async def _parse_worker(self, pending, parsed):
+        """Парсинг артикулов из общей очереди в очередь на анализ"""
+        while True:
+            try:
+                article = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            # Записи лога парсинга помечаются артикулом
+            request_id.set(article)
+            try:
+                if self.replay:
+                    reviews = await WildberriesParser().replay(article, reextract=self.reextract)
+                else:
+                    reviews = await WildberriesParser().parse(article)
+            except Exception as e:
+                logger.error(f"Ошибка при парсинге {article}: {e}")
+                reviews = None
+            # Очередь ограничена: парсинг ждет, если инференс не успевает
+            await parsed.put((article, reviews))
+
+    def _report(self):
+        """Вывод прогресса и пропускной способности"""
+        elapsed = time.monotonic() - self.started_at
+        rate = self.processed / elapsed * 3600 if elapsed > 0 else 0.0
+        print(
+            f"\rГотово: {self.processed}/{len(self.articles)}, ошибок: {self.failed}, "
+            f"{rate:.0f} артикулов/час",
+            end="", flush=True
+        )
+
+    async def _analyze_batch(self, loop, pool, batch):
+        """Отправка пакета в пул и сохранение результатов"""
+        try:
+            results = await loop.run_in_executor(pool, _analyze_in_worker, [reviews for _, reviews in batch])
+        except Exception as e:
+            logger.error(f"Ошибка пакетного анализа: {e}")
+            for article, _ in batch:
+                self.checkpoint.mark(article, "failed")
+                self.failed += 1
+            self._report()
+            return
+
+        for (article, reviews), analyzed_data in zip(batch, results):
+            try:
+                self.store.append(
+                    reviews["article_id"], reviews.get("avg_rating", 0.0), analyzed_data, reviews.get("reviews_key")
+                )
+                self.checkpoint.mark(article, "done")
+                self.processed += 1
+            except Exception as e:
+                # Ошибка записи одного товара (диск, права на CSV) не останавливает весь запуск
+                logger.error(f"Не удалось сохранить результат {article}: {e}")
+                self.failed += 1
+                try:
+                    self.checkpoint.mark(article, "failed")
+                except OSError as mark_error:
+                    logger.error(f"Не удалось записать {article} в журнал прогресса: {mark_error}")
+        self._report()
+
+    async def run(self):
+        """Запуск массовой обработки"""
+        if self.skipped:
+            print(f"Пропущено уже обработанных артикулов: {self.skipped}")
+        if not self.articles:
+            print("Все артикулы уже обработаны")
+            return
+
+        # Устаревшие сырые данные удаляем перед запуском, иначе кеш растет без предела
+        CaptureCache(self.captures_dir).purge()
+
+        self.started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+
+        pending = asyncio.Queue()
+        for article in self.articles:
+            pending.put_nowait(article)
+        parsed = asyncio.Queue(maxsize=self.batch_size * self.workers * 2)
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.workers, log_queue())
+        ) as pool:
+            parsers = [
+                asyncio.create_task(self._parse_worker(pending, parsed))
+                for _ in range(self.parse_concurrency)
+            ]
+            # Пакетов в пуле не больше, чем процессов с запасом на один пакет каждому
+            inflight = asyncio.Semaphore(self.workers * 2)
+            analysis_tasks = []
+            batch = []
+
+            async def flush(batch):
+                try:
+                    await self._analyze_batch(loop, pool, batch)
+                finally:
+                    inflight.release()
+
+            for _ in range(len(self.articles)):
+                article, reviews = await parsed.get()
+                if not reviews:
+                    self.checkpoint.mark(article, "failed")
+                    self.failed += 1
+                    self._report()
+                    continue
+
+                batch.append((article, reviews))
+                if len(batch) >= self.batch_size:
+                    await inflight.acquire()
+                    analysis_tasks.append(asyncio.create_task(flush(batch)))
+                    batch = []
+
+            if batch:
+                await inflight.acquire()
+                analysis_tasks.append(asyncio.create_task(flush(batch)))
+            await asyncio.gather(*parsers, *analysis_tasks)
+
+        print()
+        print(f"Завершено: обработано {self.processed}, ошибок {self.failed}")
+
+
+def _read_articles(path):
+    """Чтение артикулов из файла: по одному на строку, # - комментарий"""
+    articles = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            article = line.split("#", 1)[0].strip()
+            if article and article not in seen:
+                seen.add(article)
+                articles.append(article)
+    return articles
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Массовый анализ отзывов по списку артикулов")
+    arg_parser.add_argument("input", help="Файл со списком артикулов или ссылок")
+    arg_parser.add_argument("--checkpoint", default=None,
+                            help="Журнал прогресса (по умолчанию data/<имя файла>.checkpoint.jsonl, "
+                                 "с --replay - data/<имя файла>.replay.checkpoint.jsonl)")
+    arg_parser.add_argument("--parse-concurrency", type=int, default=4,
+                            help="Максимум одновременно работающих браузеров")
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="Количество процессов инференса (по умолчанию по числу ядер, "
+                                 "но не больше, чем помещается копий моделей в половину памяти)")
+    arg_parser.add_argument("--batch-size", type=int, default=16,
+                            help="Количество товаров в одном пакете инференса")
+    arg_parser.add_argument("--replay", action="store_true",
+                            help="Анализировать сохраненные сырые данные без обращения к сайту")
+    arg_parser.add_argument("--reextract", action="store_true",
+                            help="С --replay извлекать отзывы заново из сохраненного HTML страницы")
+    args = arg_parser.parse_args()
+
+    if not os.path.isfile(args.input):
+        print(f"Файл не найден: {args.input}")
+        sys.exit(1)
+
+    os.makedirs("data", exist_ok=True)
+    # Прогресс выводится в консоль, лог пишется только в файл
+    setup_logging("batch.log", console=False)
+    # У повторного анализа свой журнал: иначе он пропустил бы все артикулы, уже обработанные парсингом
+    suffix = ".replay.checkpoint.jsonl" if args.replay else ".checkpoint.jsonl"
+    checkpoint = args.checkpoint or os.path.join(
+        "data", f"{os.path.splitext(os.path.basename(args.input))[0]}{suffix}"
+    )
+
+    runner = BatchRunner(
+        _read_articles(args.input),
+        checkpoint,
+        parse_concurrency=args.parse_concurrency,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        replay=args.replay,
+        reextract=args.reextract
+    )
+    asyncio.run(runner.run())
+
+
+if __name__ == "__main__":
+    main()
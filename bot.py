@@ -2,42 +2,28 @@ import asyncio
 import logging
 import os
 import sys
+import signal
 os.environ['PYTORCH_CUDA_ALLOC_CONF'] = 'expandable_segments:True'
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher, html
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
 
-from parser_async import WildberriesParser
-from analyzer_async import Analyzer
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    filename="bot.log",
-    filemode="a",
-    encoding="utf-8"
-)
-logger = logging.getLogger(__name__)
-
-# Убираем ВСЕ обработчики по умолчанию
-logger.handlers.clear()
+from workers import WorkerPool
+from deadline import Deadline
+from precompute import ResultCache, Precomputer, article_from_text, is_complete
+from capture_cache import CaptureCache
+from log_setup import setup_logging, request_id
 
-# Добавляем обработчик ТОЛЬКО для файла
-file_handler = logging.FileHandler("bot.log", encoding="utf-8", mode="a")
-file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-logger.addHandler(file_handler)
-
-# Создаем обработчик для вывода в консоль
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-console_handler.setFormatter(console_formatter)
-logger.addHandler(console_handler)
+# Настройка логирования (обработчики подключает setup_logging при запуске)
+logger = logging.getLogger(__name__)
 
 # Загрузка переменных окружения из .env файла
 load_dotenv()
@@ -45,9 +31,97 @@ load_dotenv()
 # Получение токена из переменных окружения
 TOKEN = os.getenv("BOT_TOKEN")
 
+# Файл лога в формате JSON, ротируется по размеру
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+
+# Адрес Bot API: собственный сервер telegram-bot-api или заглушка нагрузочного теста
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Количество процессов парсинга и анализа и их предел памяти
+WORKERS = int(os.getenv("BOT_WORKERS", "2"))
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "4096"))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Настройки webhook: публичный адрес, путь, секрет и адрес встроенного сервера
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Максимальное количество товаров в одном сравнении
+COMPARE_MAX_ITEMS = int(os.getenv("COMPARE_MAX_ITEMS", "5"))
+
+# Крайний срок обработки запроса в секундах; половина отводится на парсинг
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "180"))
+
+# Сколько секунд при остановке ждать завершения начатых запросов
+SHUTDOWN_TIMEOUT = float(os.getenv("BOT_SHUTDOWN_TIMEOUT", "300"))
+
+# Пул процессов-обработчиков, создается при запуске бота
+pool = None
+
+# Готовые результаты анализа и их фоновый пересчет для популярных товаров
+result_cache = ResultCache()
+precomputer = None
+
 # Создание диспетчера
 dp = Dispatcher()
 
+# Обрабатываемые сейчас обновления, их дожидаемся при остановке
+inflight = set()
+
+# Текущий запрос каждого чата; новый запрос отменяет предыдущий
+active_requests = {}
+superseded = set()
+
+@dp.update.outer_middleware()
+async def track_inflight(handler, event, data):
+    """Учет обновлений, обработка которых еще не закончена"""
+    # Все записи лога по обновлению, включая обработчики в других процессах, получают его номер
+    request_id.set(str(event.update_id))
+    task = asyncio.current_task()
+    inflight.add(task)
+    try:
+        return await handler(event, data)
+    finally:
+        inflight.discard(task)
+
+def _take_over_chat(chat_id):
+    """
+    Регистрация запроса чата с отменой предыдущего, еще не завершенного
+    """
+    previous = active_requests.get(chat_id)
+    if previous is not None and not previous.done():
+        superseded.add(previous)
+        previous.cancel()
+    active_requests[chat_id] = asyncio.current_task()
+    precomputer.begin_live()
+
+def _release_chat(chat_id):
+    """
+    Снятие регистрации запроса чата после его завершения
+    """
+    task = asyncio.current_task()
+    if active_requests.get(chat_id) is task:
+        del active_requests[chat_id]
+    superseded.discard(task)
+    precomputer.end_live()
+
+async def _delete_messages(chat_id, messages):
+    """
+    Удаление служебных сообщений, которые успели отправить
+    """
+    for msg in messages:
+        if msg is None:
+            continue
+        try:
+            await bot.delete_message(chat_id, msg.message_id)
+        except Exception:
+            pass
+
 # Обработчик команды /start
 @dp.message(CommandStart())
 async def command_start_handler(message: Message) -> None:
@@ -80,6 +154,7 @@ async def help_command_handler(message: Message) -> None:
         "1. Найди артикул товара на Wildberries\n"
         "2. Отправь мне артикул или ссылку\n"
         "3. Я проанализирую отзывы и покажу результаты\n\n"
+        f"Для сравнения 2–{COMPARE_MAX_ITEMS} товаров отправь /compare и артикулы или ссылки через пробел\n\n"
         "Примечания:\n"
         "- Сбор и анализ отзывов может занять некоторое время\n"
         "- Я анализирую достоинства, недостатки и комментарии отдельно\n"
@@ -87,6 +162,74 @@ async def help_command_handler(message: Message) -> None:
     )
     logger.info(f"Отправлена справка пользователю {user_info}")
 
+# Обработчик команды /compare
+@dp.message(Command("compare"))
+async def compare_command_handler(message: Message) -> None:
+    """
+    Обработчик команды /compare: сравнение нескольких товаров в одном ответе
+    """
+    user_info = f"{message.from_user.full_name} (id: {message.from_user.id})"
+    # Артикулы и ссылки после команды, через пробел, запятую или с новой строки
+    items = list(dict.fromkeys(
+        item for item in message.text.replace(",", " ").split()[1:]
+        if "wildberries.ru" in item or item.isdigit()
+    ))
+    logger.info(f"Пользователь {user_info} запросил сравнение: {items}")
+    
+    if not 2 <= len(items) <= COMPARE_MAX_ITEMS:
+        await message.answer(
+            f'❌ Отправьте от 2 до {COMPARE_MAX_ITEMS} артикулов или ссылок после команды.\n'
+            'Например: /compare 12345678 87654321'
+        )
+        return
+    
+    # Сравнение тоже заменяет предыдущий запрос чата
+    _take_over_chat(message.chat.id)
+    deadline = Deadline(REQUEST_TIMEOUT)
+    status = None
+    try:
+        status = await message.answer(f'🔍 Собираю отзывы по {len(items)} товарам одновременно...')
+        parsed = await pool.submit("parse_many", items, deadline=deadline.portion(0.5))
+        products = [reviews for reviews in parsed if reviews]
+        failed = [item for item, reviews in zip(items, parsed) if not reviews]
+        if failed:
+            logger.warning(f"Не удалось получить отзывы для {len(failed)} товаров из {len(items)}: {failed}")
+        if not products:
+            await bot.delete_message(message.chat.id, status.message_id)
+            await message.answer('⚠️ Не удалось получить отзывы ни по одному из товаров.')
+            return
+        
+        await bot.edit_message_text(
+            '⚖️ Анализирую отзывы всех товаров...', chat_id=message.chat.id, message_id=status.message_id
+        )
+        analyses = await pool.submit("analyze_many", products, deadline=deadline)
+        await bot.delete_message(message.chat.id, status.message_id)
+        
+        response_text = await _format_comparison(products, [a["analyzed_data"] for a in analyses])
+        if failed:
+            response_text += "\n\n⚠️ Не удалось получить отзывы по товарам:\n" + "\n".join(
+                html.quote(item) for item in failed
+            )
+        for chunk in _split_message(response_text):
+            await message.answer(chunk, parse_mode=ParseMode.HTML)
+        logger.info(f"Сравнение отправлено пользователю {user_info}")
+    except asyncio.CancelledError:
+        await _delete_messages(message.chat.id, [status])
+        if asyncio.current_task() not in superseded:
+            raise  # Остановка бота
+        logger.info(f"Сравнение для пользователя {user_info} отменено новым запросом")
+        await message.answer('⏹ Сравнение отменено: получен новый запрос.')
+    except asyncio.TimeoutError:
+        logger.warning(f"Сравнение для пользователя {user_info} не уложилось в {REQUEST_TIMEOUT:.0f} с")
+        await _delete_messages(message.chat.id, [status])
+        await message.answer(f'⏱ Не удалось сравнить товары за {REQUEST_TIMEOUT:.0f} с, попробуйте позже.')
+    except Exception as e:
+        logger.error(f"Ошибка при сравнении товаров для пользователя {user_info}: {e}", exc_info=True)
+        await _delete_messages(message.chat.id, [status])
+        await message.answer(f'⛔ Произошла ошибка: {str(e)}')
+    finally:
+        _release_chat(message.chat.id)
+
 # Обработчик текстовых сообщений
 @dp.message()
 async def process_message(message: Message) -> None:
@@ -101,44 +244,74 @@ async def process_message(message: Message) -> None:
     if "wildberries.ru" in text or text.isdigit():
         logger.info(f"Начинаем обработку запроса для артикула/ссылки: {text}")
 
-        # Сообщение о начале работы
-        status_start = await message.answer('🔍 Начинаю сбор и анализ отзывов. Это может занять некоторое время...')
+        # Учитываем запрос для фонового пересчета популярных товаров
+        article = article_from_text(text)
+        if article:
+            precomputer.record(article)
+
+        # Предыдущий запрос этого чата больше не нужен
+        _take_over_chat(message.chat.id)
+        deadline = Deadline(REQUEST_TIMEOUT)
+        status_start = status_parse = status_analyze = None
 
         try:
-            # Создание экземпляров парсера и анализатора
-            parser = WildberriesParser()
-            analyzer = Analyzer()
-
-            # Запуск парсинга
-            logger.info(f"Запускаем парсинг для: {text}")
-            # Отправляем сообщение о начале парсинга
-            status_parse = await message.answer('💡 Запускаю парсинг отзывов...')
-            
-            reviews = await parser.parse(text)
+            # Популярный товар уже посчитан фоном или недавним запросом
+            cached = result_cache.get(article) if article else None
+            if cached:
+                logger.info(f"Отдаем готовый результат анализа для: {text}")
+                reviews, analysis = cached
+            else:
+                # Сообщение о начале работы
+                status_start = await message.answer('🔍 Начинаю сбор и анализ отзывов. Это может занять некоторое время...')
 
-            if not reviews:
-                logger.warning(f"Отзывы не найдены или произошла ошибка при парсинге для: {text}")
+                # Запуск парсинга
+                logger.info(f"Запускаем парсинг для: {text}")
+                # Отправляем сообщение о начале парсинга
+                status_parse = await message.answer('💡 Запускаю парсинг отзывов...')
+            
+                # Парсингу отводится половина срока, остальное - анализу. Ключи готовых
+                # результатов позволяют не собирать отзывы, общие с другим вариантом
+                known_keys = result_cache.fresh_keys(REQUEST_TIMEOUT) if article else set()
+                reviews = await pool.submit("parse", (text, known_keys), deadline=deadline.portion(0.5))
+
+                # У вариантов одной карточки отзывы общие: анализ другого варианта подходит и этому
+                analysis = result_cache.get_shared(article, reviews) if article and reviews else None
+                if reviews and reviews.get("reviews_shared") and not analysis:
+                    # Общий результат пропал, пока шел парсинг: без отзывов анализировать нечего
+                    logger.warning(f"Готовый результат {reviews['reviews_key']} недоступен, собираем отзывы {text} заново")
+                    reviews = await pool.submit("parse", text, deadline=deadline.portion(0.5))
+
+                if not reviews:
+                    logger.warning(f"Отзывы не найдены или произошла ошибка при парсинге для: {text}")
                 
-                # Удаляем служебные сообщения
-                for msg in [status_start, status_parse]:
-                    await bot.delete_message(message.chat.id, msg.message_id)
+                    # Удаляем служебные сообщения
+                    for msg in [status_start, status_parse]:
+                        await bot.delete_message(message.chat.id, msg.message_id)
                 
-                await message.answer('⚠️ Отзывов по товару не найдено или произошла ошибка при парсинге.')
-                return
+                    await message.answer('⚠️ Отзывов по товару не найдено или произошла ошибка при парсинге.')
+                    return
+
+                logger.info(f"Парсинг успешно завершен для: {text}")
+
+                if analysis:
+                    logger.info(f"Отзывы {text} общие с уже проанализированным вариантом ({reviews['reviews_key']})")
+                else:
+                    # Отправляем сообщение о начале анализа
+                    status_analyze = await message.answer('⚖️ Приступаю к анализу отзывов...')
 
-            logger.info(f"Парсинг успешно завершен для: {text}")
+                    # Анализ отзывов
+                    logger.info(f"Начинаем анализ отзывов для: {text}")
+                    analysis = await pool.submit("analyze", reviews, deadline=deadline)
+                    logger.info(f"Анализ отзывов завершен, результаты сохранены в: {analysis['csv_path']}")
 
-            # Отправляем сообщение о начале анализа
-            status_analyze = await message.answer('⚖️ Приступаю к анализу отзывов...')
+                    # Пустой результат и результат, урезанный из-за срока, не кешируем
+                    if article and is_complete(analysis):
+                        result_cache.put(article, reviews, analysis)
 
-            # Анализ отзывов
-            logger.info(f"Начинаем анализ отзывов для: {text}")
-            csv_path, analyzed_data = await analyzer.analyze_reviews_data_async(reviews)
-            logger.info(f"Анализ отзывов завершен, результаты сохранены в: {csv_path}")
+            analyzed_data = analysis["analyzed_data"]
 
             # Удаляем все служебные сообщения
-            for msg in [status_start, status_parse, status_analyze]:
-                await bot.delete_message(message.chat.id, msg.message_id)
+            await _delete_messages(message.chat.id, [status_start, status_parse, status_analyze])
 
             # Формируем ответное сообщение
             product_name = reviews.get('product_name', f'Артикул {reviews["article_id"]}')
@@ -166,19 +339,29 @@ async def process_message(message: Message) -> None:
             await message.answer(response_text, parse_mode=ParseMode.HTML)
             logger.info(f"Результаты успешно отправлены пользователю {user_info}")
 
+        except asyncio.CancelledError:
+            await _delete_messages(message.chat.id, [status_start, status_parse, status_analyze])
+            if asyncio.current_task() not in superseded:
+                raise  # Остановка бота
+            logger.info(f"Запрос {text} пользователя {user_info} отменен новым запросом")
+            await message.answer(f'⏹ Запрос {html.quote(text)} отменен: получен новый запрос.')
+
+        except asyncio.TimeoutError:
+            logger.warning(f"Запрос {text} пользователя {user_info} не уложился в {REQUEST_TIMEOUT:.0f} с")
+            await _delete_messages(message.chat.id, [status_start, status_parse, status_analyze])
+            await message.answer(f'⏱ Не удалось обработать запрос за {REQUEST_TIMEOUT:.0f} с, попробуйте позже.')
+
         except Exception as e:
             logger.error(f"Ошибка при обработке сообщения от пользователя {user_info}: {e}", exc_info=True)
 
             # Попытаемся удалить все временные сообщения, если они были
-            for msg in [status_start, getattr(status_parse, 'message_id', None), getattr(status_analyze, 'message_id', None)]:
-                if msg:
-                    try:
-                        await bot.delete_message(message.chat.id, msg.message_id if hasattr(msg, 'message_id') else msg)
-                    except Exception:
-                        pass
+            await _delete_messages(message.chat.id, [status_start, status_parse, status_analyze])
 
             await message.answer(f'⛔ Произошла ошибка: {str(e)}')
             logger.info(f"Отправлено сообщение об ошибке пользователю {user_info}")
+
+        finally:
+            _release_chat(message.chat.id)
     else:
         logger.warning(f"Получен некорректный запрос от пользователя {user_info}: {text}")
         await message.answer(
@@ -215,6 +398,30 @@ async def _calculate_overall_sentiment(analyzed_data):
     # Определяем преобладающую тональность
     return max(sentiment_counts, key=sentiment_counts.get)
 
+# Эмодзи категорий в ответах
+CATEGORY_EMOJIS = {
+    "Достоинства": "🔺",
+    "Недостатки": "🔻",
+    "Комментарий": "💬"
+}
+
+def _clean_summary(category, summary):
+    """
+    Суммаризация без служебных заглушек и повтора названия категории
+    
+    Returns:
+        str: Текст для ответа или None, если показывать нечего
+    """
+    if not summary or summary in ["Нет данных.", "Не удалось сформировать описание."]:
+        return None
+    
+    # Проверка и удаление дублирования категории в начале текста
+    if category == "Достоинства" and summary.startswith("Достоинства:"):
+        summary = summary.replace("Достоинства:", "", 1).strip()
+    elif category == "Недостатки" and summary.startswith("Недостатки:"):
+        summary = summary.replace("Недостатки:", "", 1).strip()
+    return summary
+
 async def _format_summary(analyzed_data):
     """
     Форматирование суммаризации отзывов
@@ -225,61 +432,130 @@ async def _format_summary(analyzed_data):
     Returns:
         str: Отформатированная суммаризация
     """
-    result = "\n\n📝📝📝 Суммаризация 📝📝📝\n"
-    
-    # Словарь соответствия категорий и эмоджи
-    category_emojis = {
-        "Достоинства": "🔺",
-        "Недостатки": "🔻",
-        "Комментарий": "💬"
-    }
-
+    lines = ""
     for item in analyzed_data:
         category = item["category"]
-        summary = item["summary"]
+        summary = _clean_summary(category, item["summary"])
         
-        if summary and summary not in ["Нет данных.", "Не удалось сформировать описание."]:
-            emoji = category_emojis.get(category, "")
-            
-            # Проверка и удаление дублирования категории в начале текста
-            if category == "Достоинства" and summary.startswith("Достоинства:"):
-                summary = summary.replace("Достоинства:", "", 1).strip()
-            elif category == "Недостатки" and summary.startswith("Недостатки:"):
-                summary = summary.replace("Недостатки:", "", 1).strip()
-            
-            result += f"\n<b>{emoji}{category}:</b> {summary}\n"
+        if summary:
+            emoji = CATEGORY_EMOJIS.get(category, "")
+            lines += f"\n<b>{emoji}{category}:</b> {summary}\n"
+    
+    # При нехватке времени суммаризация пропускается, пустой заголовок не выводим
+    if not lines:
+        return "\n\n📝 Суммаризация не успела сформироваться, показана только тональность."
+    return "\n\n📝📝📝 Суммаризация 📝📝📝\n" + lines
+
+async def _format_comparison(products, analyses):
+    """
+    Форматирование сравнения товаров: сводная таблица и суммаризации по категориям
+    
+    Args:
+        products (list): Данные отзывов товаров
+        analyses (list): Списки проанализированных данных в порядке товаров
+        
+    Returns:
+        str: Отформатированное сравнение
+    """
+    result = "📊📊📊 Сравнение товаров 📊📊📊\n\n"
+    for idx, reviews in enumerate(products, 1):
+        product_name = html.quote(reviews.get("product_name") or f'Артикул {reviews["article_id"]}')
+        result += f"<b>{idx}.</b> {product_name} ({reviews['article_id']})\n"
+    
+    # Сводная таблица моноширинным шрифтом, чтобы колонки совпадали
+    rows = [f"{'№':<3}{'Рейтинг':<9}Общая оценка"]
+    for idx, (reviews, analyzed_data) in enumerate(zip(products, analyses), 1):
+        avg_rating = reviews.get("avg_rating")
+        rating = f"{avg_rating:.1f}" if avg_rating else "—"
+        rows.append(f"{idx:<3}{rating:<9}{await _calculate_overall_sentiment(analyzed_data)}")
+    result += "\n<pre>" + "\n".join(rows) + "</pre>\n"
+    
+    # Суммаризации одной категории идут рядом для всех товаров
+    for category, emoji in CATEGORY_EMOJIS.items():
+        lines = []
+        for idx, analyzed_data in enumerate(analyses, 1):
+            for item in analyzed_data:
+                summary = _clean_summary(category, item["summary"]) if item["category"] == category else None
+                if summary:
+                    lines.append(f"<b>{idx}.</b> {summary} <i>({item['sentiment']})</i>")
+        if lines:
+            result += f"\n<b>{emoji}{category}:</b>\n" + "\n".join(lines) + "\n"
     
     return result
 
+def _split_message(text, limit=4096):
+    """
+    Разбиение длинного ответа на сообщения по границам абзацев
+    
+    Args:
+        text (str): Текст ответа
+        limit (int): Максимальная длина сообщения Telegram
+        
+    Returns:
+        list: Части ответа
+    """
+    chunks = []
+    current = ""
+    for block in text.split("\n\n"):
+        candidate = f"{current}\n\n{block}" if current else block
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        current = block[:limit]
+    if current:
+        chunks.append(current)
+    return chunks
+
 async def main() -> None:
     """
     Основная функция запуска бота
     """
-    global bot 
+    global bot, pool, precomputer
 
     # Проверка наличия токена
     if not TOKEN:
         logger.error("Токен бота не найден. Убедитесь, что файл .env содержит переменную BOT_TOKEN.")
         sys.exit(1)
     
+    # Без секрета любой, кто знает адрес, может присылать боту поддельные обновления
+    if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+        logger.error("Для режима webhook в .env нужны переменные WEBHOOK_URL и WEBHOOK_SECRET.")
+        sys.exit(1)
+    
     # Создание директории для данных
     os.makedirs("data", exist_ok=True)
     logger.info("Создана директория для данных")
     
     # Инициализация бота с настройками
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
     bot = Bot(
         token=TOKEN, 
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     logger.info("Бот инициализирован")
     
+    # Запуск процессов парсинга и анализа
+    pool = WorkerPool(workers=WORKERS, max_rss_mb=WORKER_MAX_RSS_MB)
+    await pool.start()
+    logger.info(f"Запущено обработчиков: {WORKERS}")
+    
+    # Фоновый пересчет популярных товаров и очистка кеша сырых данных в простое
+    precomputer = Precomputer(pool, result_cache, capture_cache=CaptureCache(os.path.join("data", "captures")))
+    precomputer.start()
+    
     # Запуск бота
     try:
         print("\n" + "="*40)
         print("🚀 Бот запущен. Ожидаем запросы...")
         print("="*40 + "\n")
-        logger.info("🚀 Бот запущен. Ожидаем запросы...")
-        await dp.start_polling(bot)
+        logger.info(f"🚀 Бот запущен в режиме {BOT_MODE}. Ожидаем запросы...")
+        if BOT_MODE == "webhook":
+            await _run_webhook()
+        else:
+            await _run_polling()
     except KeyboardInterrupt:
         print("\n" + "="*40)
         print("🛑 Бот остановлен вручную")
@@ -289,9 +565,70 @@ async def main() -> None:
         logger.error(f"Критическая ошибка: {e}", exc_info=True)
         print(f"❌ Критическая ошибка: {e}")
     finally:
+        await _drain_inflight()
+        await precomputer.stop()
+        await pool.stop()
         logger.info("Сессия бота закрыта")
         await bot.session.close()
 
+async def _run_polling():
+    """
+    Получение обновлений long polling
+    """
+    # Telegram не отдает обновления через getUpdates, пока установлен webhook
+    await bot.delete_webhook()
+    # Сессия нужна начатым запросам для ответа, ее закрываем сами после их завершения
+    await dp.start_polling(bot, close_bot_session=False)
+
+async def _run_webhook():
+    """
+    Получение обновлений через webhook на встроенном aiohttp-сервере
+    """
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook-сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info("Webhook зарегистрирован в Telegram")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    try:
+        await stop_event.wait()
+        logger.info("Получен сигнал остановки, новые обновления не принимаются")
+    finally:
+        # Webhook не удаляем: обновления получат другие экземпляры или этот после перезапуска
+        await site.stop()
+        await _drain_inflight()
+        # Обработчик webhook при остановке приложения закрывает сессию бота
+        await runner.cleanup()
+
+async def _drain_inflight():
+    """
+    Ожидание завершения начатых запросов перед остановкой
+    """
+    if not inflight:
+        return
+    logger.info(f"Ожидаем завершения запросов: {len(inflight)} (не более {SHUTDOWN_TIMEOUT:.0f} с)")
+    done, pending = await asyncio.wait(set(inflight), timeout=SHUTDOWN_TIMEOUT)
+    if pending:
+        logger.warning(f"Не дождались завершения запросов: {len(pending)}, они будут прерваны")
+        for task in pending:
+            task.cancel()
+
 if __name__ == "__main__":
+    # Логирование настраивается только здесь: процессы пула импортируют этот модуль повторно
+    setup_logging(LOG_FILE)
     # Запуск бота
     asyncio.run(main())
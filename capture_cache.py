@@ -0,0 +1,188 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class CaptureCache:
+    """Сжатый кеш сырых данных парсинга с адресацией по содержимому"""
+
+    def __init__(self, root=os.path.join("data", "captures"), ttl=None, store_payload=None):
+        """
+        Args:
+            root (str): Директория кеша
+            ttl (float): Время жизни записи в секундах (по умолчанию из CAPTURE_TTL, 7 дней)
+            store_payload (bool): Сохранять HTML страницы отзывов
+                (по умолчанию из CAPTURE_STORE_PAYLOAD, выключено)
+        """
+        if ttl is None:
+            ttl = float(os.getenv("CAPTURE_TTL", str(7 * 24 * 3600)))
+        if store_payload is None:
+            store_payload = os.getenv("CAPTURE_STORE_PAYLOAD", "0") == "1"
+
+        self.root = root
+        self.ttl = ttl
+        self.store_payload = store_payload
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_dir = os.path.join(root, "index")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _object_path(self, digest):
+        """Путь к объекту по его хешу"""
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.gz")
+
+    def _index_path(self, key):
+        """Путь к индексной записи ключа"""
+        return os.path.join(self.index_dir, f"{key}.json")
+
+    def _write_atomic(self, path, data):
+        """Запись файла через временный файл, чтобы читатели не видели его частично"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _put_object(self, data):
+        """Сохранение сжатого объекта, возвращает его sha256"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.isfile(path):
+            # mtime=0 делает сжатый файл детерминированным
+            self._write_atomic(path, gzip.compress(data, compresslevel=6, mtime=0))
+        return digest
+
+    def _get_object(self, digest):
+        """Чтение и распаковка объекта"""
+        with open(self._object_path(digest), "rb") as f:
+            return gzip.decompress(f.read())
+
+    def put(self, key, capture, payload=None):
+        """
+        Сохранение сырых данных парсинга
+
+        Args:
+            key (str): Ключ записи (артикул)
+            capture (dict): Извлеченные записи: информация о товаре и списки отзывов
+            payload (str): HTML страницы отзывов (сохраняется, если включено)
+        """
+        try:
+            data = json.dumps(capture, ensure_ascii=False, sort_keys=True).encode("utf-8")
+            entry = {"capture": self._put_object(data), "captured_at": time.time()}
+            if payload and self.store_payload:
+                entry["payload"] = self._put_object(payload.encode("utf-8"))
+            self._write_atomic(self._index_path(key), json.dumps(entry).encode("utf-8"))
+            logger.info(f"Сырые данные {key} сохранены в кеш ({entry['capture'][:12]})")
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить сырые данные {key}: {e}")
+
+    def link(self, alias, key, info=None):
+        """
+        Ссылка на запись под другим ключом: варианты товара с общими отзывами
+
+        Args:
+            alias (str): Ключ, по которому тоже нужно находить запись (артикул варианта)
+            key (str): Ключ записи с данными
+            info (dict): Собственные данные варианта (название, рейтинг), хранятся в самой ссылке
+        """
+        try:
+            entry = {"alias": key, "captured_at": time.time()}
+            if info:
+                entry["info"] = info
+            self._write_atomic(self._index_path(alias), json.dumps(entry).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить ссылку {alias} -> {key}: {e}")
+
+    def _read_entry(self, key):
+        """Индексная запись ключа с переходом по ссылке"""
+        with open(self._index_path(key), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if "alias" in entry:
+            with open(self._index_path(entry["alias"]), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        return entry
+
+    def get(self, key, max_age=None):
+        """
+        Чтение сырых данных парсинга
+
+        Args:
+            key (str): Ключ записи или ссылки на нее (артикул)
+            max_age (float): Максимальный возраст записи (по умолчанию ttl)
+
+        Returns:
+            dict: Сохраненные данные или None, если записи нет или она устарела
+        """
+        max_age = self.ttl if max_age is None else max_age
+        try:
+            entry = self._read_entry(key)
+            if max_age and time.time() - entry["captured_at"] > max_age:
+                return None
+            capture = json.loads(self._get_object(entry["capture"]).decode("utf-8"))
+            capture["captured_at"] = entry["captured_at"]
+            return capture
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get_info(self, key):
+        """
+        Собственные данные варианта из ссылки на общую запись
+
+        Returns:
+            dict: Данные, переданные в link(), или None, если ключ не ссылка
+        """
+        try:
+            with open(self._index_path(key), "r", encoding="utf-8") as f:
+                return json.load(f).get("info")
+        except (OSError, ValueError):
+            return None
+
+    def get_payload(self, key):
+        """HTML страницы отзывов, если он был сохранен"""
+        try:
+            entry = self._read_entry(key)
+            if "payload" not in entry:
+                return None
+            return self._get_object(entry["payload"]).decode("utf-8")
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def purge(self):
+        """
+        Удаление устаревших записей и объектов, на которые больше никто не ссылается
+
+        Returns:
+            int: Количество удаленных объектов
+        """
+        now = time.time()
+        referenced = set()
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if self.ttl and now - entry.get("captured_at", 0) > self.ttl:
+                os.remove(path)
+                continue
+            referenced.add(entry.get("capture"))
+            referenced.add(entry.get("payload"))
+
+        removed = 0
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                # Свежий объект может принадлежать записи, индекс которой еще пишется
+                if name.endswith(".gz") and name[:-3] not in referenced and now - os.path.getmtime(path) > 60:
+                    os.remove(path)
+                    removed += 1
+        logger.info(f"Очистка кеша сырых данных: удалено объектов {removed}")
+        return removed
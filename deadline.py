@@ -0,0 +1,36 @@
+import time
+
+
+class Deadline:
+    """
+    Крайний срок обработки запроса
+
+    Хранит абсолютное время, поэтому передается в процессы-обработчики
+    вместе с задачей и везде означает один и тот же момент.
+    """
+
+    def __init__(self, timeout):
+        """
+        Args:
+            timeout (float): Сколько секунд отведено на запрос, начиная с текущего момента
+        """
+        self.at = time.time() + timeout
+
+    def remaining(self):
+        """Оставшееся время в секундах (не меньше нуля)"""
+        return max(0.0, self.at - time.time())
+
+    def expired(self):
+        """Срок уже истек"""
+        return self.remaining() <= 0
+
+    def portion(self, fraction):
+        """Срок для этапа: доля оставшегося времени, остальное - следующим этапам"""
+        return Deadline(self.remaining() * fraction)
+
+    def cap(self, seconds):
+        """Таймаут операции, не выходящий за крайний срок"""
+        return min(seconds, self.remaining())
+
+    def __repr__(self):
+        return f"Deadline(remaining={self.remaining():.1f})"
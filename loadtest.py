@@ -0,0 +1,508 @@
+"""
+Нагрузочный тест бота без сети: локальные заглушки Telegram Bot API и маркетплейса
+
+Бот запускается отдельным процессом со своим пулом обработчиков и браузером,
+обновления получает long polling'ом от заглушки Telegram, а страницы товаров
+и отзывов - от заглушки маркетплейса, которая отдает записанные данные
+из кеша сырых данных (data/captures) или синтетические товары.
+
+Запуск: python loadtest.py --rates 0.1 0.5 1 --requests 50
+"""
+import os
+import sys
+import json
+import html
+import math
+import time
+import random
+import signal
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+
+from aiohttp import web
+
+from capture_cache import CaptureCache
+from workers import rss_bytes
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Каталог проекта, из которого запускается бот
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Токен заглушки; формат как у настоящего, иначе aiogram его не примет
+FAKE_TOKEN = "123456:LOADTEST"
+
+# Начало итоговых ответов бота; остальные сообщения служебные
+FINAL_PREFIXES = ("✅", "⚠️", "⛔", "❌", "⏱", "⏹")
+ERROR_PREFIXES = ("⚠️", "⛔", "❌", "⏱", "⏹")
+
+# Предложения для синтетических товаров, если записанных данных нет
+SYNTHETIC_SENTENCES = {
+    "advantages": [
+        "Хорошее качество, швы ровные.",
+        "Удобный, сидит по фигуре.",
+        "Красивый цвет, как на фото.",
+        "Быстрая доставка, упаковка целая.",
+        "Ткань плотная и приятная к телу.",
+    ],
+    "disadvantages": [
+        "Высокая цена.",
+        "Маломерит на размер.",
+        "После стирки немного села.",
+        "Нитки торчат в нескольких местах.",
+        "Запах в упаковке, пришлось проветривать.",
+    ],
+    "comments": [
+        "В целом доволен покупкой, но есть некоторые недочеты.",
+        "Заказываю уже второй раз, рекомендую.",
+        "Рост 176 см, размер 48 подошел идеально.",
+        "Продавцу спасибо, ответил на все вопросы.",
+        "За свои деньги нормально.",
+    ],
+}
+
+
+def load_fixtures(captures_dir, synthetic=0, seed=1):
+    """
+    Товары для заглушки маркетплейса
+
+    Args:
+        captures_dir (str): Каталог кеша сырых данных с записанными товарами
+        synthetic (int): Количество синтетических товаров (добавляются, если записанных нет)
+        seed (int): Зерно генератора синтетических товаров
+
+    Returns:
+        dict: Артикул -> {"product_name", "avg_rating", "reviews"}
+    """
+    fixtures = {}
+    if os.path.isdir(os.path.join(captures_dir, "index")):
+        cache = CaptureCache(captures_dir)
+        for name in sorted(os.listdir(cache.index_dir)):
+            key = name[:-len(".json")]
+            # Общие записи карточек (imt<id>) - не артикулы: товары берем из ссылок вариантов
+            if key.startswith("imt"):
+                continue
+            # max_age=0 отключает проверку возраста: для теста подходят и старые записи
+            capture = cache.get(key, max_age=0)
+            if capture:
+                fixtures[key] = {**capture, **(cache.get_info(key) or {})}
+
+    if not fixtures and not synthetic:
+        synthetic = 20
+    rng = random.Random(seed)
+    for i in range(synthetic):
+        article = str(90000000 + i)
+        fixtures[article] = {
+            "product_name": f"Тест / Товар {i}",
+            "avg_rating": round(rng.uniform(3.5, 5.0), 1),
+            "reviews": {
+                key: [rng.choice(sentences) for _ in range(rng.randint(5, 40))]
+                for key, sentences in SYNTHETIC_SENTENCES.items()
+            }
+        }
+    return fixtures
+
+
+def percentile(values, q):
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class FakeTelegram:
+    """Заглушка Telegram Bot API: раздает обновления и записывает ответы бота"""
+
+    def __init__(self):
+        self.calls = []
+        self.ready = asyncio.Event()
+        self._updates = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._waiters = {}  # chat_id -> future итогового ответа
+
+    def send_text(self, chat_id, text):
+        """
+        Отправка боту сообщения от пользователя
+
+        Returns:
+            asyncio.Future: Итоговый ответ бота (текст)
+        """
+        self._updates.append({
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": f"Пользователь {chat_id}"},
+                "text": text
+            }
+        })
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = future
+        self._new_update.set()
+        return future
+
+    async def _get_updates(self, params):
+        """Long polling: обновления после offset или пустой ответ по таймауту"""
+        offset = int(params.get("offset", 0) or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout=float(params.get("timeout", 0) or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(self._updates)
+
+    def _message(self, params):
+        """Сообщение, которое Bot API вернул бы на отправку"""
+        chat_id = int(params["chat_id"])
+        text = params.get("text", "")
+        message_id = int(params.get("message_id") or next(self._message_ids))
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text
+        }
+
+    async def handle(self, request):
+        """Обработчик /bot<token>/<method>"""
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        elif method == "getUpdates":
+            self.ready.set()
+            result = await self._get_updates(params)
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(params)
+            self.calls.append((time.monotonic(), method, result["chat"]["id"], result["text"]))
+            waiter = self._waiters.get(result["chat"]["id"])
+            if method == "sendMessage" and waiter and not waiter.done() and result["text"].startswith(FINAL_PREFIXES):
+                waiter.set_result(result["text"])
+        elif method == "deleteMessage":
+            self.calls.append((time.monotonic(), method, int(params["chat_id"]), params.get("message_id")))
+            result = True
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+class FakeMarketplace:
+    """Заглушка маркетплейса: карточки товаров и страницы отзывов из записанных данных"""
+
+    def __init__(self, fixtures, latency=0.0):
+        """
+        Args:
+            fixtures (dict): Товары из load_fixtures
+            latency (float): Задержка ответа в секундах, как у настоящего сайта
+        """
+        self.fixtures = fixtures
+        self.latency = latency
+        self.hits = 0
+
+    async def _page(self, article):
+        """Товар по артикулу с имитацией задержки сети"""
+        self.hits += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        fixture = self.fixtures.get(article)
+        if fixture is None:
+            raise web.HTTPNotFound()
+        return fixture
+
+    async def product(self, request):
+        """Карточка товара с названием, оценкой и ссылкой на отзывы"""
+        article = request.match_info["article"]
+        fixture = await self._page(article)
+        rating = f"{fixture['avg_rating']:.1f}".replace(".", ",")
+        body = (
+            f'<div class="product-page__header"><h1>{html.escape(fixture["product_name"])}</h1></div>'
+            f'<span class="address-rate-mini">{rating}</span>'
+            f'<a class="comments__btn-all" href="/catalog/{article}/feedbacks">Смотреть все отзывы</a>'
+        )
+        return web.Response(text=f"<html><head><title>Товар</title></head><body>{body}</body></html>",
+                            content_type="text/html")
+
+    async def feedbacks(self, request):
+        """Страница отзывов в разметке, которую разбирает парсер"""
+        fixture = await self._page(request.match_info["article"])
+        reviews = fixture["reviews"]
+        headers = {"advantages": "Достоинства:", "disadvantages": "Недостатки:", "comments": "Комментарий:"}
+        blocks = []
+        for i in range(max((len(items) for items in reviews.values()), default=0)):
+            items = []
+            for key, header in headers.items():
+                if i < len(reviews.get(key, [])):
+                    items.append(
+                        f'<p class="feedback__text--item"><span class="feedback__text--item-bold">{header}</span> '
+                        f'{html.escape(reviews[key][i])}</p>'
+                    )
+            blocks.append(f'<div class="feedback__content">{"".join(items)}</div>')
+        body = '<button class="btn-base">Этот вариант товара</button>' + "".join(blocks)
+        return web.Response(text=f"<html><head><title>Отзывы</title></head><body>{body}</body></html>",
+                            content_type="text/html")
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/catalog/{article}/detail.aspx", self.product)
+        app.router.add_get("/catalog/{article}/feedbacks", self.feedbacks)
+        return app
+
+
+def tree_rss(root_pid):
+    """Суммарная память процесса и всех его потомков (браузеры, обработчики)"""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                # Имя процесса в скобках может содержать пробелы, ppid идет после него
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_bytes(pid) or 0
+        stack.extend(children.get(pid, []))
+    return total
+
+
+async def _serve(app, port):
+    """Запуск aiohttp-приложения на локальном порту"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+class LoadTest:
+    """Прогон бота под нагрузкой с заданными интенсивностями запросов"""
+
+    def __init__(self, fixtures, rates, requests, workers=2, timeout=900, site_latency=0.0,
+                 rate_limit=None, workdir=None, seed=1):
+        """
+        Args:
+            fixtures (dict): Товары для заглушки маркетплейса
+            rates (list): Интенсивности входящих запросов (запросов в секунду), по этапу на каждую
+            requests (int): Запросов на этапе
+            workers (int): Процессов-обработчиков бота
+            timeout (float): Сколько ждать ответа на запрос, секунд
+            site_latency (float): Задержка ответа заглушки маркетплейса, секунд
+            rate_limit (float): PARSER_RATE_LIMIT для бота (по умолчанию как в окружении)
+            workdir (str): Рабочий каталог бота (по умолчанию временный)
+            seed (int): Зерно генератора интервалов между запросами
+        """
+        self.fixtures = fixtures
+        self.rates = rates
+        self.requests = requests
+        self.workers = workers
+        self.timeout = timeout
+        self.rate_limit = rate_limit
+        self.workdir = workdir or tempfile.mkdtemp(prefix="reviews-loadtest-")
+        os.makedirs(self.workdir, exist_ok=True)
+        self.rng = random.Random(seed)
+        self.telegram = FakeTelegram()
+        self.marketplace = FakeMarketplace(fixtures, site_latency)
+        self.chat_ids = itertools.count(1000)
+        self.peak_rss = 0
+        self.process = None
+
+    async def _start_bot(self, telegram_port, marketplace_port):
+        """Запуск бота отдельным процессом, направленного на заглушки"""
+        env = dict(os.environ)
+        env.update({
+            "BOT_TOKEN": FAKE_TOKEN,
+            "BOT_MODE": "polling",
+            "BOT_WORKERS": str(self.workers),
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{telegram_port}",
+            "PARSER_BASE_URL": f"http://127.0.0.1:{marketplace_port}",
+            # Модели берутся только из локального кеша
+            "HF_HUB_OFFLINE": "1",
+            "TRANSFORMERS_OFFLINE": "1",
+            # Замеряем полный путь запроса, без готовых результатов и фонового пересчета
+            "RESULT_CACHE_TTL": "0",
+        })
+        if self.rate_limit is not None:
+            env["PARSER_RATE_LIMIT"] = str(self.rate_limit)
+
+        output = open(os.path.join(self.workdir, "bot.out"), "ab")
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(PROJECT_DIR, "bot.py"),
+            cwd=self.workdir, env=env, stdout=output, stderr=output
+        )
+        output.close()
+        logger.info(f"Бот запущен (pid {self.process.pid}), рабочий каталог {self.workdir}")
+
+    async def _sample_memory(self):
+        """Периодический замер памяти бота и его потомков"""
+        while True:
+            self.peak_rss = max(self.peak_rss, tree_rss(self.process.pid))
+            await asyncio.sleep(0.5)
+
+    async def _request(self, article):
+        """
+        Один запрос пользователя
+
+        Returns:
+            tuple: (задержка до итогового ответа или None при таймауте, признак ошибки)
+        """
+        started = time.monotonic()
+        future = self.telegram.send_text(next(self.chat_ids), article)
+        try:
+            text = await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return None, True
+        return time.monotonic() - started, text.startswith(ERROR_PREFIXES)
+
+    async def _stage(self, rate):
+        """Этап с пуассоновским потоком запросов заданной интенсивности"""
+        self.peak_rss = 0
+        articles = list(self.fixtures)
+        tasks = []
+        started = time.monotonic()
+        for _ in range(self.requests):
+            tasks.append(asyncio.create_task(self._request(self.rng.choice(articles))))
+            await asyncio.sleep(self.rng.expovariate(rate))
+        results = await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+        latencies = [latency for latency, _ in results if latency is not None]
+        errors = sum(1 for _, error in results if error)
+        return {
+            "rate": rate,
+            "requests": len(results),
+            "completed": len(latencies),
+            "errors": errors,
+            "error_rate": errors / len(results),
+            "throughput": (len(results) - errors) / elapsed,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+            "peak_rss_mb": self.peak_rss / 2**20
+        }
+
+    async def run(self, warmup=1):
+        """
+        Запуск заглушек и бота, прогон этапов и остановка
+
+        Args:
+            warmup (int): Запросов до замеров (загрузка моделей, запуск браузеров)
+
+        Returns:
+            list: Статистика этапов
+        """
+        telegram_runner, telegram_port = await _serve(self.telegram.app(), 0)
+        marketplace_runner, marketplace_port = await _serve(self.marketplace.app(), 0)
+        await self._start_bot(telegram_port, marketplace_port)
+        sampler = asyncio.create_task(self._sample_memory())
+
+        stages = []
+        try:
+            await asyncio.wait_for(self.telegram.ready.wait(), timeout=120)
+            logger.info("Бот получает обновления, прогрев")
+            articles = list(self.fixtures)
+            await asyncio.gather(*(self._request(articles[i % len(articles)]) for i in range(warmup)))
+
+            for rate in self.rates:
+                logger.info(f"Этап: {rate} запросов/с, всего {self.requests}")
+                stats = await self._stage(rate)
+                stages.append(stats)
+                _print_stage(stats)
+        finally:
+            sampler.cancel()
+            # SIGINT: бот перестает принимать обновления и дожидается начатых запросов
+            if self.process.returncode is None:
+                self.process.send_signal(signal.SIGINT)
+                try:
+                    await asyncio.wait_for(self.process.wait(), timeout=120)
+                except asyncio.TimeoutError:
+                    self.process.kill()
+            await telegram_runner.cleanup()
+            await marketplace_runner.cleanup()
+        return stages
+
+
+def _print_stage(stats):
+    """Строка отчета по этапу"""
+    def seconds(value):
+        return f"{value:8.1f}" if value is not None else f"{'—':>8}"
+
+    print(
+        f"{stats['rate']:>8.2f} {stats['requests']:>8} {stats['completed']:>8} {stats['error_rate']:>7.1%} "
+        f"{stats['throughput'] * 60:>9.2f} {seconds(stats['p50'])} {seconds(stats['p90'])} "
+        f"{seconds(stats['p95'])} {seconds(stats['p99'])} {seconds(stats['max'])} {stats['peak_rss_mb']:>9.0f}",
+        flush=True
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальных заглушках")
+    arg_parser.add_argument("--rates", type=float, nargs="+", default=[0.1, 0.5, 1.0],
+                            help="Интенсивности входящих запросов, запросов в секунду (этап на каждую)")
+    arg_parser.add_argument("--requests", type=int, default=50, help="Запросов на этапе")
+    arg_parser.add_argument("--workers", type=int, default=2, help="Процессов-обработчиков бота")
+    arg_parser.add_argument("--captures", default=os.path.join("data", "captures"),
+                            help="Кеш сырых данных с записанными товарами")
+    arg_parser.add_argument("--synthetic", type=int, default=0,
+                            help="Добавить синтетических товаров (если записанных нет - 20)")
+    arg_parser.add_argument("--site-latency", type=float, default=0.2,
+                            help="Задержка ответа заглушки маркетплейса, секунд")
+    arg_parser.add_argument("--rate-limit", type=float, default=None,
+                            help="PARSER_RATE_LIMIT для бота (по умолчанию из окружения)")
+    arg_parser.add_argument("--timeout", type=float, default=900, help="Ожидание ответа на запрос, секунд")
+    arg_parser.add_argument("--warmup", type=int, default=1, help="Запросов до замеров")
+    arg_parser.add_argument("--workdir", default=None, help="Рабочий каталог бота (по умолчанию временный)")
+    arg_parser.add_argument("--report", default=None, help="Сохранить статистику этапов в JSON")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    fixtures = load_fixtures(args.captures, args.synthetic)
+    logger.info(f"Товаров в заглушке маркетплейса: {len(fixtures)}")
+
+    load_test = LoadTest(
+        fixtures, args.rates, args.requests,
+        workers=args.workers,
+        timeout=args.timeout,
+        site_latency=args.site_latency,
+        rate_limit=args.rate_limit,
+        workdir=args.workdir
+    )
+    print(f"{'запр/с':>8} {'запросов':>8} {'ответов':>8} {'ошибки':>7} {'товар/мин':>9} "
+          f"{'p50, с':>8} {'p90, с':>8} {'p95, с':>8} {'p99, с':>8} {'макс, с':>8} {'пик, МБ':>9}")
+    stages = asyncio.run(load_test.run(warmup=args.warmup))
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(stages, f, ensure_ascii=False, indent=2)
+        print(f"Отчет сохранен: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+import sys
+import copy
+import json
+import atexit
+import logging
+import contextvars
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Идентификатор запроса, к которому относятся записи лога текущей задачи
+request_id = contextvars.ContextVar("request_id", default="-")
+
+# Очередь записей от всех процессов и поток, который пишет их в файл и консоль
+_queue = None
+_listener = None
+
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавление идентификатора запроса в запись"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    """Передача записи в очередь без форматирования: трассировку сохраняем отдельным полем"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _apply_levels():
+    """
+    Уровни логирования: общий из LOG_LEVEL и по модулям из LOG_LEVELS
+
+    LOG_LEVELS задается через запятую, например "aiogram=WARNING,parser_async=DEBUG"
+    """
+    logging.getLogger().setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for item in os.getenv("LOG_LEVELS", "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+
+def _install_queue_handler(queue):
+    """Замена обработчиков корневого логгера на отправку в очередь"""
+    handler = _QueueHandler(queue)
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    _apply_levels()
+
+
+def setup_logging(log_file, console=True):
+    """
+    Настройка логирования главного процесса
+
+    Все логгеры пишут в очередь, а файл и консоль обслуживает отдельный
+    поток, поэтому запись на диск не блокирует event loop. Файл в формате
+    JSON по строке на запись, с ротацией по размеру.
+
+    Args:
+        log_file (str): Файл лога
+        console (bool): Дублировать записи в консоль в текстовом виде
+
+    Returns:
+        multiprocessing.Queue: Очередь для подключения процессов-обработчиков
+    """
+    global _queue, _listener
+    if _listener is not None:
+        return _queue
+
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 2**20))),
+        backupCount=int(os.getenv("LOG_BACKUPS", "5")),
+        encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(console_handler)
+
+    # Контекст spawn совпадает с контекстом пула обработчиков
+    _queue = multiprocessing.get_context("spawn").Queue()
+    _listener = QueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _install_queue_handler(_queue)
+    atexit.register(stop_logging)
+    return _queue
+
+
+def setup_worker_logging(queue):
+    """
+    Подключение дочернего процесса к очереди логов главного процесса
+
+    Args:
+        queue (multiprocessing.Queue): Очередь из setup_logging (None - оставить как есть)
+    """
+    if queue is not None:
+        _install_queue_handler(queue)
+
+
+def log_queue():
+    """Очередь логов для передачи в дочерние процессы (None, если логирование не настроено)"""
+    return _queue
+
+
+def stop_logging():
+    """Запись оставшихся в очереди записей и остановка потока логирования"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
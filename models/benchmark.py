@@ -0,0 +1,142 @@
+"""
+Пропускная способность инференса при 1/2/4/8 одновременных запросах
+
+Каждый одновременный запрос обслуживает отдельный процесс, как в пуле бота.
+Сравниваются режимы:
+  baseline - исходный путь: медленные токенизаторы, подсчет токенов без кеша,
+             потоки PyTorch по умолчанию, без прогрева
+  default  - быстрые токенизаторы с кешем, потоки по умолчанию, без прогрева
+  tuned    - то же, плюс configure_threads по числу процессов и прогрев перед замером
+
+Запуск: python -m models.benchmark [--concurrency 1 2 4 8] [--requests 4]
+"""
+import time
+import argparse
+import statistics
+import multiprocessing
+
+
+def _make_reviews(index):
+    """Отзывы товара для одного запроса, разной длины у разных запросов"""
+    from analyzer_async import CATEGORY_NAMES, WARMUP_SENTENCES
+
+    repeats = (2, 6, 12)[index % 3]
+    clusters = [
+        {"text": f"{sentence} Заказ {index}-{i}.", "count": 1}
+        for i, sentence in enumerate(WARMUP_SENTENCES * repeats)
+    ]
+    text = " ".join(cluster["text"] for cluster in clusters)
+    return {
+        "article_id": f"bench{index}",
+        **{key: text for key in CATEGORY_NAMES},
+        "clusters": {key: clusters for key in CATEGORY_NAMES},
+        "review_counts": {key: len(clusters) for key in CATEGORY_NAMES}
+    }
+
+
+def _uncached_counter(tokenizer):
+    """Подсчет токенов как до CachedTokenCounter: каждый вызов кодирует тексты заново"""
+    def count(texts):
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    return count
+
+
+def _use_baseline_tokenizers(analyzer):
+    """Возврат анализатора к медленным токенизаторам и подсчету токенов без кеша"""
+    from transformers import AutoTokenizer, GPT2Tokenizer
+    from models import sentiment, summarization
+
+    sentiment_tokenizer = AutoTokenizer.from_pretrained(sentiment.MODEL_NAME, use_fast=False)
+    analyzer.sentiment_analyzer.tokenizer = sentiment_tokenizer
+    analyzer.sentiment_analyzer.token_counter = _uncached_counter(sentiment_tokenizer)
+
+    summary_tokenizer = GPT2Tokenizer.from_pretrained(summarization.MODEL_NAME, eos_token='</s>')
+    if summary_tokenizer.pad_token is None:
+        summary_tokenizer.pad_token = summary_tokenizer.eos_token
+    summarization._tokenizer = summary_tokenizer
+    summarization._token_counter = _uncached_counter(summary_tokenizer)
+
+
+def _run_worker(mode, workers, requests, barrier, results):
+    """Процесс-обработчик: подготовка по режиму и замер своих запросов"""
+    import torch
+    from analyzer_async import Analyzer
+    from models.manager import model_manager
+    from models.runtime import configure_threads
+
+    if mode == "tuned":
+        configure_threads(workers)
+    analyzer = Analyzer()
+    if mode == "baseline":
+        _use_baseline_tokenizers(analyzer)
+    if mode == "tuned":
+        analyzer.warm_up()
+    else:
+        # Веса загружаем в обоих режимах: замеряется инференс, а не чтение с диска
+        with model_manager.use("sentiment"), model_manager.use("summarizer"):
+            pass
+
+    reviews = [_make_reviews(i) for i in range(requests)]
+    barrier.wait()
+    latencies = []
+    for reviews_data in reviews:
+        started = time.perf_counter()
+        analyzer.analyze_batch([reviews_data])
+        latencies.append(time.perf_counter() - started)
+    results.put((torch.get_num_threads(), latencies))
+
+
+def _measure(mode, concurrency, requests):
+    """Запуск concurrency процессов и сбор задержек"""
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(concurrency + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_run_worker, args=(mode, concurrency, requests, barrier, results))
+        for _ in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    started = time.perf_counter()
+    collected = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    latencies = [latency for _, worker_latencies in collected for latency in worker_latencies]
+    first = [worker_latencies[0] for _, worker_latencies in collected]
+    return {
+        "threads": collected[0][0],
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "max": max(latencies),
+        "first": statistics.mean(first)
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк инференса при одновременных запросах")
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                            help="Количества одновременных запросов")
+    arg_parser.add_argument("--requests", type=int, default=4,
+                            help="Запросов на каждый процесс")
+    arg_parser.add_argument("--modes", nargs="+", default=["baseline", "default", "tuned"],
+                            choices=["baseline", "default", "tuned"], help="Режимы для сравнения")
+    args = arg_parser.parse_args()
+
+    print(f"{'режим':<8} {'запросов':>8} {'потоки':>6} {'товаров/с':>10} "
+          f"{'p50, с':>8} {'макс, с':>8} {'первый, с':>10}")
+    for concurrency in args.concurrency:
+        for mode in args.modes:
+            stats = _measure(mode, concurrency, args.requests)
+            print(
+                f"{mode:<8} {concurrency:>8} {stats['threads']:>6} {stats['throughput']:>10.2f} "
+                f"{stats['p50']:>8.2f} {stats['max']:>8.2f} {stats['first']:>10.2f}",
+                flush=True
+            )
+
+
+if __name__ == "__main__":
+    main()
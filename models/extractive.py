@@ -0,0 +1,140 @@
+import re
+import math
+import logging
+import numpy as np
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+_SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+")
+_TOKEN_PATTERN = re.compile(r"\w\w+")
+
+
+class ExtractiveSelector:
+    """Отбор наиболее представительных предложений под бюджет токенов модели"""
+
+    def __init__(self, similarity_threshold=0.1, redundancy_threshold=0.7,
+                 diversity=0.3, damping=0.85, max_iter=50):
+        """
+        Args:
+            similarity_threshold (float): Минимальное косинусное сходство для ребра графа
+            redundancy_threshold (float): Сходство, выше которого предложение считается повтором
+            diversity (float): Вес штрафа за сходство с уже выбранными предложениями (MMR)
+            damping (float): Коэффициент затухания для LexRank
+            max_iter (int): Максимальное число итераций степенного метода
+        """
+        self.similarity_threshold = similarity_threshold
+        self.redundancy_threshold = redundancy_threshold
+        self.diversity = diversity
+        self.damping = damping
+        self.max_iter = max_iter
+
+    def split_sentences(self, clusters):
+        """Разбиение кластеров отзывов на предложения с весами"""
+        sentences = []
+        weights = []
+        for cluster in clusters:
+            for sentence in _SENTENCE_SPLIT_PATTERN.split(cluster["text"]):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                if sentence[-1] not in ".!?":
+                    sentence += "."
+                sentences.append(sentence)
+                weights.append(cluster.get("count", 1))
+        return sentences, np.asarray(weights, dtype=np.float64)
+
+    def _tfidf(self, sentences):
+        """Матрица TF-IDF с L2-нормированными строками"""
+        vocabulary = {}
+        rows, cols = [], []
+        for i, sentence in enumerate(sentences):
+            for token in _TOKEN_PATTERN.findall(sentence.lower()):
+                rows.append(i)
+                cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+        matrix = np.zeros((len(sentences), max(len(vocabulary), 1)), dtype=np.float64)
+        if rows:
+            np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), 1.0)
+
+        df = np.count_nonzero(matrix, axis=0)
+        idf = np.log((1.0 + len(sentences)) / (1.0 + df)) + 1.0
+        matrix *= idf
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _centrality(self, similarity, weights):
+        """LexRank с учетом количества отзывов в кластере"""
+        n = similarity.shape[0]
+        graph = np.where(similarity >= self.similarity_threshold, similarity, 0.0)
+        # Голос предложения пропорционален числу отзывов, в которых оно встретилось
+        graph = graph * weights[np.newaxis, :]
+        row_sums = graph.sum(axis=1, keepdims=True)
+        row_sums[row_sums == 0] = 1.0
+        transition = graph / row_sums
+
+        prior = weights / weights.sum()
+        scores = np.full(n, 1.0 / n)
+        for _ in range(self.max_iter):
+            updated = (1 - self.damping) * prior + self.damping * transition.T @ scores
+            if np.abs(updated - scores).sum() < 1e-6:
+                scores = updated
+                break
+            scores = updated
+        return scores
+
+    def select(self, clusters, token_budget, count_tokens):
+        """
+        Выбор предложений, которые лучше всего покрывают отзывы категории
+
+        Args:
+            clusters (list): Кластеры отзывов вида {"text": str, "count": int}
+            token_budget (int): Доступное количество токенов
+            count_tokens (callable): Функция подсчета токенов для списка предложений
+
+        Returns:
+            str: Выбранные предложения в исходном порядке
+        """
+        sentences, weights = self.split_sentences(clusters)
+        if not sentences:
+            return ""
+
+        lengths = count_tokens(sentences)
+
+        # Если все помещается в бюджет, ранжирование не нужно
+        if sum(lengths) <= token_budget:
+            return " ".join(sentences)
+
+        similarity = self._tfidf(sentences)
+        similarity = similarity @ similarity.T
+        scores = self._centrality(similarity, weights)
+        scores = scores / scores.max()
+
+        selected = []
+        used = 0
+        max_similarity = np.zeros(len(sentences))
+        available = np.ones(len(sentences), dtype=bool)
+
+        while available.any():
+            # MMR: центральность минус сходство с уже выбранным
+            mmr = (1 - self.diversity) * scores - self.diversity * max_similarity
+            mmr[~available] = -math.inf
+            best = int(np.argmax(mmr))
+            available[best] = False
+
+            if max_similarity[best] >= self.redundancy_threshold:
+                continue
+            if used + lengths[best] > token_budget:
+                continue
+
+            selected.append(best)
+            used += lengths[best]
+            max_similarity = np.maximum(max_similarity, similarity[best])
+
+        logger.info(
+            f"Экстрактивный отбор: {len(selected)} из {len(sentences)} предложений, "
+            f"{used}/{token_budget} токенов"
+        )
+        return " ".join(sentences[i] for i in sorted(selected))
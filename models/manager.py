@@ -0,0 +1,225 @@
+import os
+import gc
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import torch
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def model_size_bytes(model):
+    """Объем памяти, занимаемый параметрами и буферами модели"""
+    return sum(t.numel() * t.element_size() for t in model.parameters()) + \
+        sum(t.numel() * t.element_size() for t in model.buffers())
+
+
+class _Entry:
+    """Загруженная модель и сведения о ее использовании"""
+
+    def __init__(self, model, size):
+        self.model = model
+        self.size = size
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class ModelManager:
+    """Загрузка моделей по требованию с бюджетом памяти и выгрузкой по простою"""
+
+    def __init__(self, memory_budget_mb=0, idle_timeout=600.0, check_interval=30.0):
+        """
+        Args:
+            memory_budget_mb (int): Суммарный предел памяти моделей в МБ (0 - без предела)
+            idle_timeout (float): Время простоя в секундах, после которого модель выгружается (0 - никогда)
+            check_interval (float): Период проверки простаивающих моделей
+        """
+        self.memory_budget = memory_budget_mb * 2**20
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+
+        self._loaders = {}
+        self._sizes = {}  # ожидаемый объем модели: оценка при регистрации, затем фактический
+        self._entries = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def register(self, name, loader, expected_size_mb=0):
+        """
+        Регистрация модели
+
+        Args:
+            name (str): Имя модели
+            loader (callable): Функция без аргументов, возвращающая загруженную модель
+            expected_size_mb (int): Оценка объема модели в МБ, под который освобождается
+                место до первой загрузки
+        """
+        with self._lock:
+            if name not in self._loaders:
+                self._loaders[name] = loader
+                self._sizes[name] = expected_size_mb * 2**20
+                self._load_locks[name] = threading.Lock()
+
+    def _evict_locked(self, name):
+        """Выгрузка модели (вызывается под self._lock)"""
+        entry = self._entries.pop(name)
+        del entry.model
+        logger.info(f"Модель {name} выгружена из памяти ({entry.size // 2**20} МБ)")
+
+    def _make_room(self, size):
+        """Выгрузка давно не используемых моделей, чтобы уложиться в бюджет"""
+        if not self.memory_budget:
+            return
+        evicted = False
+        idle = sorted(
+            (entry.last_used, name) for name, entry in self._entries.items() if entry.refs == 0
+        )
+        for _, name in idle:
+            if self.resident_bytes() + size <= self.memory_budget:
+                break
+            self._evict_locked(name)
+            evicted = True
+        if self.resident_bytes() + size > self.memory_budget:
+            logger.warning(
+                f"Бюджет памяти моделей превышен: {(self.resident_bytes() + size) // 2**20} МБ "
+                f"при пределе {self.memory_budget // 2**20} МБ"
+            )
+        if evicted:
+            self._collect()
+
+    def _collect(self):
+        """Возврат освобожденной памяти"""
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _acquire(self, name):
+        """Получение модели с увеличением счетчика использования"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry.refs += 1
+                entry.last_used = time.monotonic()
+                return entry.model
+
+        # Загрузка под отдельной блокировкой, чтобы параллельные запросы не грузили модель дважды
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None:
+                    entry.refs += 1
+                    entry.last_used = time.monotonic()
+                    return entry.model
+
+            # Место освобождаем до загрузки: иначе пик памяти на время загрузки выходит за бюджет
+            with self._lock:
+                self._make_room(self._sizes[name])
+
+            logger.info(f"Загрузка модели {name}")
+            started = time.monotonic()
+            model = self._loaders[name]()
+            size = model_size_bytes(model)
+
+            with self._lock:
+                self._sizes[name] = size
+                self._make_room(size)
+                entry = _Entry(model, size)
+                entry.refs = 1
+                self._entries[name] = entry
+            logger.info(
+                f"Модель {name} загружена за {time.monotonic() - started:.1f} с, {size // 2**20} МБ"
+            )
+            self._ensure_reaper()
+            return model
+
+    def _release(self, name):
+        """Уменьшение счетчика использования модели"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry.refs -= 1
+                entry.last_used = time.monotonic()
+
+    @contextmanager
+    def use(self, name):
+        """Контекст использования модели: модель не выгружается, пока он открыт"""
+        model = self._acquire(name)
+        try:
+            yield model
+        finally:
+            self._release(name)
+
+    def evict(self, name):
+        """Принудительная выгрузка модели, если она не используется"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.refs > 0:
+                return False
+            self._evict_locked(name)
+        self._collect()
+        return True
+
+    def evict_idle(self):
+        """Выгрузка моделей, простаивающих дольше idle_timeout"""
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            names = [
+                name for name, entry in self._entries.items()
+                if entry.refs == 0 and now - entry.last_used >= self.idle_timeout
+            ]
+            for name in names:
+                self._evict_locked(name)
+        if names:
+            self._collect()
+        return names
+
+    def _ensure_reaper(self):
+        """Запуск фонового потока выгрузки простаивающих моделей"""
+        if not self.idle_timeout or (self._reaper and self._reaper.is_alive()):
+            return
+        self._reaper = threading.Thread(target=self._reap, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        """Цикл фонового потока выгрузки"""
+        while True:
+            time.sleep(self.check_interval)
+            self.evict_idle()
+            with self._lock:
+                if not self._entries:
+                    return
+
+    def resident_bytes(self):
+        """Суммарный объем загруженных моделей"""
+        return sum(entry.size for entry in self._entries.values())
+
+    def report(self):
+        """
+        Сведения о загруженных моделях
+
+        Returns:
+            dict: Имя модели -> {"resident_mb", "in_use", "idle_seconds"}
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "resident_mb": round(entry.size / 2**20, 1),
+                    "in_use": entry.refs,
+                    "idle_seconds": round(now - entry.last_used, 1)
+                }
+                for name, entry in self._entries.items()
+            }
+
+
+# Общий менеджер моделей процесса
+model_manager = ModelManager(
+    memory_budget_mb=int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")),
+    idle_timeout=float(os.getenv("MODEL_IDLE_TIMEOUT", "600"))
+)
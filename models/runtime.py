@@ -0,0 +1,47 @@
+import os
+import logging
+
+import torch
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def available_cpus():
+    """Количество ядер, доступных процессу (с учетом ограничений cgroup/taskset)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def configure_threads(workers=1, threads=None, interop_threads=None):
+    """
+    Настройка потоков PyTorch для процесса инференса
+
+    Вызывается до первого прогона модели: после запуска пула межоператорных
+    потоков PyTorch не позволяет изменить их количество.
+
+    Args:
+        workers (int): Количество процессов инференса, делящих ядра
+        threads (int): Потоков внутри операции (по умолчанию из MODEL_THREADS
+            или доля ядер на процесс)
+        interop_threads (int): Потоков между операциями (по умолчанию из MODEL_INTEROP_THREADS, 1)
+
+    Returns:
+        tuple: (threads, interop_threads), которые действуют в процессе
+    """
+    if threads is None:
+        threads = int(os.getenv("MODEL_THREADS", "0")) or max(1, available_cpus() // max(1, workers))
+    if interop_threads is None:
+        interop_threads = int(os.getenv("MODEL_INTEROP_THREADS", "1"))
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # Пул уже запущен (инференс был раньше), оставляем как есть
+        logger.warning("Количество межоператорных потоков уже нельзя изменить")
+
+    threads, interop_threads = torch.get_num_threads(), torch.get_num_interop_threads()
+    logger.info(f"Потоки PyTorch: {threads} в операции, {interop_threads} между операциями")
+    return threads, interop_threads
@@ -1,51 +1,98 @@
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from models.manager import model_manager
+from models.tokenization import CachedTokenCounter
+
+MODEL_NAME = "cointegrated/rubert-tiny-sentiment-balanced"
+
+_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def _load_model():
+    """Загрузка весов rubert-tiny для менеджера моделей"""
+    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
+    model.eval()
+    model.to(_device)
+    return model
+
+
+model_manager.register("sentiment", _load_model, expected_size_mb=50)
 
 class SentimentAnalyzer:
     def __init__(self):
-        self.model_name = "cointegrated/rubert-tiny-sentiment-balanced"
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
-        self.model.eval()
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
-        
+        self.model_name = MODEL_NAME
+        # Быстрый токенизатор на Rust, совпадение с медленным проверяет models/tokenizer_parity.py
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        self.token_counter = CachedTokenCounter(self.tokenizer)
+        self.device = _device
+
+    def count_tokens(self, texts):
+        """Количество токенов для каждого текста из списка (с кешем)"""
+        return self.token_counter(texts)
+
+    def _label(self, probs):
+        """Тональность и уверенность по вероятностям классов"""
+        labels = ["негативная", "нейтральная", "положительная"]
+
+        # Добавляем дополнительные категории для крайних значений
+        if probs[2] > 0.97:  # Очень высокий шанс позитива
+            sentiment = "крайне положительная"
+        elif probs[0] > 0.97:  # Очень высокий шанс негатива
+            sentiment = "крайне отрицательная"
+        else:
+            sentiment = labels[probs.argmax()]
+
+        # Вычисляем уверенность в процентах
+        confidence = int(probs.max() * 100)
+
+        return sentiment, confidence
+
+    def analyze_batch(self, texts, batch_size=32):
+        """
+        Пакетный анализ тональности
+
+        Args:
+            texts (list): Тексты для анализа
+            batch_size (int): Количество текстов в одном прогоне модели
+
+        Returns:
+            list: Кортежи (тональность, уверенность в процентах)
+        """
+        results = []
+        with model_manager.use("sentiment") as model:
+            for start in range(0, len(texts), batch_size):
+                # Обрезаем текст до 512 токенов, чтобы избежать ошибки
+                inputs = self.tokenizer(
+                    texts[start:start + batch_size],
+                    return_tensors="pt", truncation=True, padding=True, max_length=512
+                )
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+
+                with torch.no_grad():
+                    outputs = model(**inputs)
+
+                # Получаем вероятности для каждого класса
+                probs = torch.softmax(outputs.logits, dim=-1).cpu().numpy()
+                results.extend(self._label(row) for row in probs)
+        return results
+
     async def analyze(self, text):
         """
         Анализ тональности текста
-        
+
         Args:
             text (str): Текст для анализа
-            
+
         Returns:
             tuple: (тональность, уверенность в процентах)
         """
         try:
-            # Обрезаем текст до 512 токенов, чтобы избежать ошибки
-            inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                
-            # Получаем вероятности для каждого класса
-            probs = torch.softmax(outputs.logits, dim=-1).cpu().numpy()[0]
-            
-            # Определяем тональность и уверенность
-            labels = ["негативная", "нейтральная", "положительная"]
-            
-            # Добавляем дополнительные категории для крайних значений
-            if probs[2] > 0.97:  # Очень высокий шанс позитива
-                sentiment = "крайне положительная"
-            elif probs[0] > 0.97:  # Очень высокий шанс негатива
-                sentiment = "крайне отрицательная"
-            else:
-                sentiment = labels[probs.argmax()]
-            
-            # Вычисляем уверенность в процентах
-            confidence = int(probs.max() * 100)
-            
-            return sentiment, confidence
+            return self.analyze_batch([text])[0]
         except Exception as e:
             print(f"Ошибка при анализе тональности: {e}")
             return "нейтральная", 0
+
+    @classmethod
+    async def release_model(cls):
+        """Ручное освобождение памяти"""
+        model_manager.evict("sentiment")
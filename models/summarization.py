@@ -1,98 +1,191 @@
 import torch
-from transformers import GPT2Tokenizer, T5ForConditionalGeneration
+from transformers import GPT2TokenizerFast, T5ForConditionalGeneration
 import re
-import gc
+import time
 import logging
+from models.manager import model_manager
+from models.tokenization import CachedTokenCounter
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Глобальные переменные для хранения модели и токенизатора
-_model = None
+# Максимальная длина входа модели в токенах
+MAX_INPUT_TOKENS = 512
+
+# Промпты в зависимости от типа поля
+PROMPTS = {
+    "Достоинства": "Кратко выдели 3-4 главных достоинства:\n",
+    "Недостатки": "Кратко выдели 2-3 главных недостатка:\n",
+    "Комментарий": "Обобщи мнение в одном предложении:\n"
+}
+
+MODEL_NAME = "RussianNLP/FRED-T5-Summarizer"
+
+# Профили декодирования: полный (лучевой поиск) и дешевый для запросов, у которых мало времени
+PROFILES = {
+    "full": {"num_beams": 4, "early_stopping": True},
+    "fast": {"num_beams": 1},
+}
+
+# Оценка времени одного вызова generate по профилям, уточняется по фактическим замерам
+_generate_seconds = {"full": 20.0, "fast": 6.0}
+
+# Токенизатор небольшой и нужен для подсчета токенов без модели, держим его постоянно
 _tokenizer = None
-_device = None
+_token_counter = None
+_device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _load_model():
+    """Загрузка весов FRED-T5 для менеджера моделей"""
+    model = T5ForConditionalGeneration.from_pretrained(MODEL_NAME)
+    model.to(_device)
+    model.eval()
+    return model
+
+
+model_manager.register("summarizer", _load_model, expected_size_mb=3200)
 
 class Summarizer:
     def __init__(self):
-        global _model, _tokenizer, _device
-
-        self.model_name = "RussianNLP/FRED-T5-Summarizer"
-
-        # Ленивая инициализация
-        if _model is None or _tokenizer is None:
-            logger.info("Ленивая инициализация модели FRED-T5")
-            _tokenizer = GPT2Tokenizer.from_pretrained(self.model_name, eos_token='</s>')
-            _model = T5ForConditionalGeneration.from_pretrained(self.model_name)
-            _device = "cuda" if torch.cuda.is_available() else "cpu"
-            _model.to(_device)
-            _model.eval()
+        global _tokenizer, _token_counter
+
+        self.model_name = MODEL_NAME
+
+        # Ленивая инициализация, веса модели загружает менеджер при первом вызове
+        if _tokenizer is None:
+            logger.info("Ленивая инициализация токенизатора FRED-T5")
+            # Быстрый токенизатор на Rust, совпадение с GPT2Tokenizer проверяет models/tokenizer_parity.py
+            _tokenizer = GPT2TokenizerFast.from_pretrained(self.model_name, eos_token='</s>')
+            # Паддинг нужен для пакетной генерации
+            if _tokenizer.pad_token is None:
+                _tokenizer.pad_token = _tokenizer.eos_token
+            _token_counter = CachedTokenCounter(_tokenizer)
     
-    async def summarize(self, text, field="Комментарий"):
+    def _postprocess(self, raw_summary, field):
+        """Очистка ответа модели и ограничение числа предложений"""
+        summary_clean = re.sub(r'\d+\.\s*', '', raw_summary).strip()
+        summary_clean = re.sub(r'\s+', ' ', summary_clean)
+
+        # Обрезаем до нужного количества предложений
+        if field in ["Достоинства", "Недостатки"]:
+            sentences = re.findall(r'[^.!?]*[.!?]', summary_clean)
+            sentences = [s.strip() for s in sentences if s.strip()]
+            max_sentences = 4 if field == "Достоинства" else 3
+            summary_clean = ' '.join(sentences[:max_sentences]).strip()
+
+            if not re.search(r'[.!?]$', summary_clean):
+                summary_clean = re.sub(r'[^.!?]*$', '', summary_clean).strip()
+
+        return summary_clean
+
+    def choose_profile(self, seconds, fields, batch_size=8):
+        """
+        Самый качественный профиль, который успеет за отведенное время
+
+        Args:
+            seconds (float): Оставшееся время в секундах
+            fields (list): Тип поля для каждого текста, который нужно суммаризировать
+            batch_size (int): Количество текстов в одном вызове generate
+
+        Returns:
+            str: Имя профиля или None, если не успевает ни один
+        """
+        # Тексты разных полей генерируются отдельными вызовами
+        calls = sum(-(-fields.count(field) // batch_size) for field in set(fields))
+        for profile in ("full", "fast"):
+            if _generate_seconds[profile] * calls <= seconds:
+                return profile
+        return None
+
+    def summarize_batch(self, texts, fields, batch_size=8, profile="full"):
+        """
+        Пакетная суммаризация текстов
+
+        Args:
+            texts (list): Тексты для суммаризации
+            fields (list): Тип поля для каждого текста
+            batch_size (int): Количество текстов в одном вызове generate
+            profile (str): Профиль декодирования из PROFILES
+
+        Returns:
+            list: Суммаризированные тексты в исходном порядке
+        """
+        summaries = [None] * len(texts)
+
+        # Группируем по типу поля: у них разные промпты и длина ответа
+        groups = {}
+        for idx, field in enumerate(fields):
+            groups.setdefault(field, []).append(idx)
+
+        # Модель удерживается в памяти, пока идет генерация
+        with model_manager.use("summarizer") as model:
+            for field, indices in groups.items():
+                prompt_intro = PROMPTS.get(field, "Обобщи текст:\n")
+                for start in range(0, len(indices), batch_size):
+                    chunk = indices[start:start + batch_size]
+                    input_texts = [f"<LM> {prompt_intro}{texts[i].strip()}" for i in chunk]
+
+                    # Токенизируем тексты с ограничением длины
+                    inputs = _tokenizer(
+                        input_texts, truncation=True, max_length=MAX_INPUT_TOKENS,
+                        padding=True, return_tensors="pt"
+                    ).to(_device)
+
+                    # Генерируем суммаризацию
+                    started = time.monotonic()
+                    with torch.no_grad():
+                        output = model.generate(
+                            inputs["input_ids"],
+                            attention_mask=inputs["attention_mask"],
+                            eos_token_id=_tokenizer.eos_token_id,
+                            min_new_tokens=10,
+                            max_new_tokens=45 if field != "Комментарий" else 100,
+                            no_repeat_ngram_size=4,
+                            do_sample=False,
+                            **PROFILES[profile]
+                        )
+                    # Скользящая оценка длительности для выбора профиля под срок запроса
+                    elapsed = time.monotonic() - started
+                    _generate_seconds[profile] = 0.7 * _generate_seconds[profile] + 0.3 * elapsed
+
+                    # Декодируем результат
+                    raw_summaries = _tokenizer.batch_decode(output, skip_special_tokens=True)
+                    for i, raw_summary in zip(chunk, raw_summaries):
+                        summaries[i] = self._postprocess(raw_summary, field)
+
+        return summaries
+
+    async def summarize(self, text, field="Комментарий", profile="full"):
         """
         Суммаризация текста
         
         Args:
             text (str): Текст для суммаризации
             field (str): Тип поля (Достоинства, Недостатки, Комментарий)
+            profile (str): Профиль декодирования из PROFILES
             
         Returns:
             str: Суммаризированный текст
         """
         try:
-            # Формируем промпт в зависимости от типа поля
-            prompts = {
-                "Достоинства": "Кратко выдели 3-4 главных достоинства:\n",
-                "Недостатки": "Кратко выдели 2-3 главных недостатка:\n",
-                "Комментарий": "Обобщи мнение в одном предложении:\n"
-            }
-            prompt_intro = prompts.get(field, "Обобщи текст:\n")
-            input_text = f"<LM> {prompt_intro}{text.strip()}"
-
-            # Токенизируем текст с ограничением длины
-            input_ids = _tokenizer.encode(input_text, truncation=True, max_length=512, return_tensors="pt").to(_device)
-
-            # Генерируем суммаризацию
-            output = _model.generate(
-                input_ids,
-                eos_token_id=_tokenizer.eos_token_id,
-                num_beams=4,
-                min_new_tokens=10,
-                max_new_tokens=45 if field != "Комментарий" else 100,
-                no_repeat_ngram_size=4,
-                do_sample=False,
-                early_stopping=True
-            )
-
-            # Декодируем результат
-            raw_summary = _tokenizer.decode(output[0], skip_special_tokens=True)
-            summary_clean = re.sub(r'\d+\.\s*', '', raw_summary).strip()
-            summary_clean = re.sub(r'\s+', ' ', summary_clean)
-
-            # Обрезаем до нужного количества предложений
-            if field in ["Достоинства", "Недостатки"]:
-                sentences = re.findall(r'[^.!?]*[.!?]', summary_clean)
-                sentences = [s.strip() for s in sentences if s.strip()]
-                max_sentences = 4 if field == "Достоинства" else 3
-                summary_clean = ' '.join(sentences[:max_sentences]).strip()
-
-                if not re.search(r'[.!?]$', summary_clean):
-                    summary_clean = re.sub(r'[^.!?]*$', '', summary_clean).strip()
-
-            return summary_clean
-            
+            return self.summarize_batch([text], [field], profile=profile)[0]
         except Exception as e:
             logger.error(f"Ошибка при суммаризации: {e}")
             return "Не удалось сформировать описание."
 
+    def count_tokens(self, texts):
+        """Количество токенов для каждого текста из списка (с кешем)"""
+        return _token_counter(texts)
+
+    def input_budget(self, field="Комментарий"):
+        """Количество токенов, доступное для текста после промпта"""
+        prompt_intro = PROMPTS.get(field, "Обобщи текст:\n")
+        prompt_tokens = _token_counter([f"<LM> {prompt_intro}"])[0]
+        return MAX_INPUT_TOKENS - prompt_tokens
+
     @classmethod
     async def release_model(cls):
         """Ручное освобождение памяти"""
-        global _model, _tokenizer, _device
-        if _model is not None:
-            del _model
-            _model = None
-            _tokenizer = None
-            _device = None
-            torch.cuda.empty_cache() if torch.cuda.is_available() else None
-            gc.collect()
-            logger.info("Модель FRED-T5 успешно удалена из памяти")
\ No newline at end of file
+        if model_manager.evict("summarizer"):
+            logger.info("Модель FRED-T5 успешно удалена из памяти")
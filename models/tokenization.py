@@ -0,0 +1,41 @@
+from collections import OrderedDict
+
+
+class CachedTokenCounter:
+    """Подсчет токенов пакетами с кешем уже посчитанных текстов"""
+
+    def __init__(self, tokenizer, maxsize=50000):
+        """
+        Args:
+            tokenizer: Токенизатор transformers (предпочтительно быстрый)
+            maxsize (int): Максимальное количество текстов в кеше
+        """
+        self.tokenizer = tokenizer
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+
+    def __call__(self, texts):
+        """
+        Количество токенов для каждого текста из списка
+
+        Args:
+            texts (list): Тексты
+
+        Returns:
+            list: Длины в токенах без служебных токенов
+        """
+        missing = list(dict.fromkeys(t for t in texts if t not in self._cache))
+        if missing:
+            # Все новые тексты кодируются одним пакетным вызовом
+            encoded = self.tokenizer(missing, add_special_tokens=False)["input_ids"]
+            for text, ids in zip(missing, encoded):
+                self._cache[text] = len(ids)
+
+        counts = []
+        for text in texts:
+            self._cache.move_to_end(text)
+            counts.append(self._cache[text])
+
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return counts
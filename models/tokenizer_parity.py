@@ -0,0 +1,66 @@
+"""
+Проверка совпадения быстрых токенизаторов с медленными на тестовых отзывах
+
+Запуск: python -m models.tokenizer_parity
+"""
+import sys
+from transformers import AutoTokenizer, GPT2Tokenizer, GPT2TokenizerFast
+
+from models.sentiment import MODEL_NAME as SENTIMENT_MODEL
+from models.summarization import MODEL_NAME as SUMMARIZER_MODEL, PROMPTS
+
+# Тексты с типичными для отзывов особенностями: регистр, числа, пунктуация, латиница
+FIXTURES = [
+    "Хорошее качество. Удобный. Красивый дизайн.",
+    "Высокая цена. Долгая доставка.",
+    "В целом доволен покупкой, но есть некоторые недочеты.",
+    "Размер 46-48, рост 176 см - село идеально!",
+    "Ткань тонкая... после стирки села на 2 размера?!",
+    "Пришло быстро, упаковка \"как надо\", продавцу спасибо",
+    "Заказывала цвет mint, пришел бирюзовый; в остальном ок.",
+    "НЕ ПОКУПАЙТЕ!!! Брак, шов разошелся через неделю",
+    "Цена/качество 10/10, беру уже третий раз",
+    "  Лишние   пробелы\tи\nпереносы строк  ",
+    "ёжик, Ёлка, щётка - проверка буквы ё",
+    "",
+]
+
+
+def _compare(name, slow, fast, texts):
+    """Сравнение input_ids двух токенизаторов, возвращает количество расхождений"""
+    mismatches = 0
+    for text in texts:
+        slow_ids = slow(text)["input_ids"]
+        fast_ids = fast(text)["input_ids"]
+        if slow_ids != fast_ids:
+            mismatches += 1
+            print(f"[{name}] расхождение для {text!r}:\n  slow={slow_ids}\n  fast={fast_ids}")
+
+    # Пакетное кодирование должно совпадать с поштучным
+    batch_ids = fast(texts)["input_ids"]
+    for text, ids in zip(texts, batch_ids):
+        if ids != fast(text)["input_ids"]:
+            mismatches += 1
+            print(f"[{name}] пакетное кодирование расходится для {text!r}")
+
+    print(f"[{name}] проверено текстов: {len(texts)}, расхождений: {mismatches}")
+    return mismatches
+
+
+def main():
+    mismatches = 0
+
+    slow = AutoTokenizer.from_pretrained(SENTIMENT_MODEL, use_fast=False)
+    fast = AutoTokenizer.from_pretrained(SENTIMENT_MODEL, use_fast=True)
+    mismatches += _compare("sentiment", slow, fast, FIXTURES)
+
+    slow = GPT2Tokenizer.from_pretrained(SUMMARIZER_MODEL, eos_token='</s>')
+    fast = GPT2TokenizerFast.from_pretrained(SUMMARIZER_MODEL, eos_token='</s>')
+    prompted = [f"<LM> {prompt}{text}" for prompt in PROMPTS.values() for text in FIXTURES]
+    mismatches += _compare("summarizer", slow, fast, FIXTURES + prompted)
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
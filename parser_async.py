@@ -2,30 +2,161 @@ import re
 import os
 import asyncio
 import logging
+import json
 import random
 from playwright.async_api import async_playwright, TimeoutError
 from bs4 import BeautifulSoup
+from text_normalizer import ReviewNormalizer
+from request_filter import RequestFilter, BASE_URL
+from capture_cache import CaptureCache
+from rate_limiter import rate_limiter, SiteBlocked, BLOCK_STATUSES, BLOCK_PAGE_MARKERS, BLOCK_PAGE_JS
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    filename="parser.log",
-    filemode="a",
-    encoding="utf-8"
-)
 logger = logging.getLogger(__name__)
 
+# Селекторы по умолчанию; "css::text=подстрока" - элемент css, содержащий текст
+DEFAULT_SELECTORS = {
+    "product_name": [
+        ".product-page__header h1",
+        ".product-line__name",
+        "h1.same-part-kt__header"  # Мобильная версия
+    ],
+    "rating": [
+        ".address-rate-mini",
+        ".product-review__rating"
+    ],
+    "reviews_button": [
+        ".comments__btn-all",  # Стандартный селектор
+        "a[data-link*='feedbacks']",  # Альтернативный селектор по атрибуту
+        "a[href*='feedbacks']",  # Еще один вариант по href
+        ".product-review__all-reviews",  # Мобильная версия
+        "button.btn-base::text=отзывы",  # Поиск по тексту
+        "a::text=отзывы",  # Еще один вариант по тексту
+        "a, button, span::text=Смотреть все отзывы"
+    ]
+}
+
+# Проверка всех селекторов групп за один вызов page.evaluate
+PROBE_SELECTORS_JS = """
+([groups, clickGroup, scroll]) => {
+    if (scroll) window.scrollBy(0, window.innerHeight);
+    const find = (selector) => {
+        const [css, text] = selector.split('::text=');
+        if (text === undefined) return document.querySelector(css);
+        const needle = text.toLowerCase();
+        for (const el of document.querySelectorAll(css)) {
+            if ((el.textContent || '').toLowerCase().includes(needle)) return el;
+        }
+        return null;
+    };
+    const result = {};
+    for (const [group, selectors] of Object.entries(groups)) {
+        result[group] = null;
+        for (const selector of selectors) {
+            let el = null;
+            try { el = find(selector); } catch (e) { continue; }
+            if (!el) continue;
+            if (group === clickGroup) el.click();
+            result[group] = {selector: selector, text: (el.textContent || '').trim()};
+            break;
+        }
+    }
+    return result;
+}
+"""
+
+# Признак загруженных отзывов на странице
+REVIEWS_LOADED_JS = """
+() => {
+    const reviews = document.querySelectorAll('.feedback__content, .comment__content, .product-feedbacks__block');
+    return reviews.length > 0;
+}
+"""
+
+# Сколько секунд оставить на разбор страницы и закрытие браузера, когда срок запроса на исходе
+SCROLL_RESERVE = 5.0
+
+# Запрос отзывов к API маркетплейса; в пути - общий для вариантов товара идентификатор карточки (imtId)
+FEEDBACK_ROOT_RE = re.compile(r"feedbacks\d*\.wb\.ru/feedbacks/v\d+/(\d+)")
+
+
+class SelectorMemory:
+    """Порядок селекторов с учетом того, какой из них сработал в прошлый раз"""
+
+    def __init__(self, path):
+        self.path = path
+        learned = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    learned = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать {path}: {e}")
+
+        self.order = {}
+        for group, defaults in DEFAULT_SELECTORS.items():
+            known = [sel for sel in learned.get(group, []) if sel in defaults]
+            self.order[group] = known + [sel for sel in defaults if sel not in known]
+
+    def ordered(self, *groups):
+        """Селекторы групп в порядке проверки"""
+        return {group: self.order[group] for group in groups}
+
+    def remember(self, group, selector):
+        """Перенос сработавшего селектора в начало и сохранение порядка"""
+        order = self.order[group]
+        if order[0] == selector:
+            return
+        order.remove(selector)
+        order.insert(0, selector)
+        # Файл общий для процессов-обработчиков: пишем через временный файл,
+        # чтобы оборванная запись не стерла выученный порядок
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.order, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить порядок селекторов: {e}")
+
+
 class WildberriesParser:
-    def __init__(self):
+    def __init__(self, emulate_human=None, variant_filter=None):
+        """
+        Args:
+            emulate_human (bool): Эмулировать движения мыши на странице товара
+                (по умолчанию из переменной окружения PARSER_EMULATE_HUMAN)
+            variant_filter (bool): Оставлять только отзывы о варианте товара из запроса
+                (по умолчанию из переменной окружения PARSER_VARIANT_FILTER, включено; без фильтра
+                отзывы общие для всех вариантов карточки и анализируются один раз)
+        """
         self.browser = None
+        self.owns_browser = True
         self.context = None
         self.page = None
+        self.request_filter = None
+        if emulate_human is None:
+            emulate_human = os.getenv("PARSER_EMULATE_HUMAN", "0") == "1"
+        self.emulate_human = emulate_human
+        if variant_filter is None:
+            variant_filter = os.getenv("PARSER_VARIANT_FILTER", "1") == "1"
+        self.variant_filter = variant_filter
         self.data_dir = "data"
+        self.normalizer = ReviewNormalizer()
         os.makedirs(self.data_dir, exist_ok=True)
+        self.selectors = SelectorMemory(os.path.join(self.data_dir, "selectors.json"))
+        self.capture_cache = CaptureCache(os.path.join(self.data_dir, "captures"))
+        self.last_payload = None
+        self.deadline = None
+        # Страницы одного парсинга делят пробный запрос полуразомкнутой цепи ограничителя
+        self.limiter_owner = rate_limiter.new_owner()
+        self.feedback_root = None
+        self.variant_filtered = False
+        self.known_keys = set()
+        self.reviews_shared = False
 
-    async def _init_browser(self):
-        """Инициализация браузера с расширенными настройками для обхода защиты"""
+    async def _launch_browser(self):
+        """Запуск браузера с расширенными настройками для обхода защиты"""
         playwright = await async_playwright().start()
         
         # Расширенные аргументы для запуска браузера
@@ -41,10 +172,20 @@ class WildberriesParser:
             f"--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
         ]
         
-        self.browser = await playwright.chromium.launch(
+        return await playwright.chromium.launch(
             headless=True,  # Для отладки можно установить False
             args=browser_args
         )
+
+    async def _init_browser(self, browser=None):
+        """
+        Инициализация контекста браузера с расширенными настройками для обхода защиты
+        
+        Args:
+            browser: Общий запущенный браузер; если не передан, запускается собственный
+        """
+        self.owns_browser = browser is None
+        self.browser = browser or await self._launch_browser()
         
         # Создаем контекст с расширенными настройками
         self.context = await self.browser.new_context(
@@ -69,9 +210,10 @@ class WildberriesParser:
             }
         )
         
-        # Настройка перехвата запросов для блокировки ненужных ресурсов
-        await self.context.route("**/*.{png,jpg,jpeg,gif,svg,woff,woff2}", lambda route: route.abort())
-        await self.context.route("**/analytics.js", lambda route: route.abort())
+        # Настройка перехвата запросов для блокировки ненужных ресурсов и учета трафика
+        self.request_filter = RequestFilter()
+        await self.request_filter.attach(self.context)
+        self.context.on("response", self._on_response)
         
         # Создаем страницу
         self.page = await self.context.new_page()
@@ -108,39 +250,71 @@ class WildberriesParser:
         """Формирование URL товара по артикулу"""
         if "wildberries.ru" in article:
             return article
-        return f"https://www.wildberries.ru/catalog/{article}/detail.aspx"
+        return f"{BASE_URL}/catalog/{article}/detail.aspx"
+
+    def _on_response(self, response):
+        """Учет ответов API маркетплейса: идентификатор отзывов карточки и ограничение запросов"""
+        match = FEEDBACK_ROOT_RE.search(response.url)
+        if match and self.feedback_root != match.group(1):
+            self.feedback_root = match.group(1)
+            logger.info(f"Отзывы товара хранятся в карточке {self.feedback_root}")
+        if response.status == 429 and self.request_filter.allows(response.url, response.request.resource_type):
+            rate_limiter.report_block(f"HTTP 429 {response.request.resource_type}")
+
+    async def _goto(self, url, page=None, attempts=3):
+        """
+        Переход по ссылке через общий ограничитель запросов
+
+        Args:
+            url (str): Адрес страницы
+            page: Страница браузера (по умолчанию основная)
+            attempts (int): Количество попыток при блокировке
+
+        Raises:
+            SiteBlocked: Сайт блокирует запросы
+        """
+        page = page or self.page
+        for _ in range(attempts):
+            await rate_limiter.acquire(self.limiter_owner, deadline=self.deadline)
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=self._timeout(30000))
+            if response and response.status in BLOCK_STATUSES:
+                reason = f"HTTP {response.status}"
+            else:
+                reason = await page.evaluate(BLOCK_PAGE_JS, list(BLOCK_PAGE_MARKERS))
+            if not reason:
+                rate_limiter.report_success()
+                return response
+            # Следующая попытка дождется паузы ограничителя
+            rate_limiter.report_block(reason)
+        raise SiteBlocked(f"Сайт блокирует запросы к {url}")
+
+    async def _probe(self, *groups, click=None, scroll=False, page=None):
+        """Поиск элементов по всем селекторам групп за один запрос к странице"""
+        page = page or self.page
+        found = await page.evaluate(
+            PROBE_SELECTORS_JS, [self.selectors.ordered(*groups), click, scroll]
+        )
+        for group, match in found.items():
+            if match:
+                self.selectors.remember(group, match["selector"])
+        return found
 
-    async def _get_product_info(self, article_id):
+    async def _get_product_info(self, article_id, page=None):
         """Получение информации о товаре (название и средняя оценка)"""
         try:
-            # Ищем название товара
-            product_name_element = await self.page.query_selector(".product-page__header h1")
-            if not product_name_element:
-                # Альтернативный селектор для названия товара
-                product_name_element = await self.page.query_selector(".product-line__name")
-            
-            if not product_name_element:
-                # Еще один альтернативный селектор для мобильной версии
-                product_name_element = await self.page.query_selector("h1.same-part-kt__header")
+            found = await self._probe("product_name", "rating", page=page)
             
             product_name = "Неизвестный товар"
-            if product_name_element:
-                product_name = await product_name_element.text_content()
+            if found["product_name"]:
+                product_name = found["product_name"]["text"]
                 # Если название содержит бренд и слеш, берем только часть после слеша
                 if "/" in product_name:
                     product_name = product_name.split("/", 1)[1].strip()
             
-            # Ищем среднюю оценку
-            rating_element = await self.page.query_selector(".address-rate-mini")
-            if not rating_element:
-                # Альтернативный селектор для оценки
-                rating_element = await self.page.query_selector(".product-review__rating")
-            
             avg_rating = "0.0"
-            if rating_element:
-                avg_rating = await rating_element.text_content()
+            if found["rating"]:
                 # Заменяем запятую на точку для корректного преобразования в float
-                avg_rating = avg_rating.replace(",", ".")
+                avg_rating = found["rating"]["text"].replace(",", ".")
             
             logger.info(f"Получена информация о товаре: {product_name}, рейтинг: {avg_rating}")
             return {
@@ -154,83 +328,86 @@ class WildberriesParser:
                 "avg_rating": 0.0
             }
 
-    async def _emulate_human_behavior(self):
+    async def _emulate_human_behavior(self, page=None):
         """Эмуляция человеческого поведения для обхода защиты"""
+        page = page or self.page
         try:
             # Случайные движения мыши
             for _ in range(3):
                 x = random.randint(100, 800)
                 y = random.randint(100, 600)
-                await self.page.mouse.move(x, y)
+                await page.mouse.move(x, y)
                 await asyncio.sleep(random.uniform(0.1, 0.3))
             
             # Случайные прокрутки
             for _ in range(2):
-                await self.page.mouse.wheel(0, random.randint(100, 300))
+                await page.mouse.wheel(0, random.randint(100, 300))
                 await asyncio.sleep(random.uniform(0.2, 0.5))
             
             logger.info("Выполнена эмуляция человеческого поведения")
         except Exception as e:
             logger.error(f"Ошибка при эмуляции человеческого поведения: {e}")
 
+    def _timeout(self, default_ms):
+        """Таймаут операции в мс, не выходящий за крайний срок запроса"""
+        if self.deadline is None:
+            return default_ms
+        # Нулевой таймаут Playwright означает "без ограничения", поэтому минимум 1 мс
+        return max(1, int(self.deadline.cap(default_ms / 1000) * 1000))
+
+    def _budget_low(self, reserve):
+        """Осталось меньше reserve секунд до крайнего срока"""
+        return self.deadline is not None and self.deadline.remaining() < reserve
+
+    async def _wait_for_reviews(self, timeout):
+        """Ожидание появления блоков отзывов на странице"""
+        try:
+            await self.page.wait_for_function(REVIEWS_LOADED_JS, timeout=self._timeout(timeout))
+            return True
+        except TimeoutError:
+            return False
+
     async def _find_reviews_button(self):
-        """Поиск кнопки 'Смотреть все отзывы' с учетом различных версий сайта"""
+        """Поиск и нажатие кнопки 'Смотреть все отзывы' с учетом различных версий сайта"""
         try:
             # Прокручиваем страницу вниз несколько раз, чтобы найти кнопку отзывов
-            for i in range(10):  # Увеличиваем количество попыток прокрутки
-                logger.info(f"Попытка {i+1} найти кнопку отзывов")
-                
-                # Прокручиваем страницу
-                await self.page.evaluate("window.scrollBy(0, window.innerHeight)")
+            for i in range(10):
+                # Прокрутка, проверка всех селекторов и клик - один запрос к странице
+                found = await self._probe("reviews_button", click="reviews_button", scroll=True)
+                if found["reviews_button"]:
+                    logger.info(
+                        f"Найдена кнопка отзывов с селектором: {found['reviews_button']['selector']} "
+                        f"(попытка {i+1})"
+                    )
+                    return True
                 await asyncio.sleep(0.5)
-                
-                # Проверяем различные селекторы для кнопки отзывов
-                selectors = [
-                    ".comments__btn-all",  # Стандартный селектор
-                    "a[data-link*='feedbacks']",  # Альтернативный селектор по атрибуту
-                    "a[href*='feedbacks']",  # Еще один вариант по href
-                    ".product-review__all-reviews",  # Мобильная версия
-                    "button.btn-base:has-text('отзывы')",  # Поиск по тексту
-                    "a:has-text('отзывы')"  # Еще один вариант по тексту
-                ]
-                
-                for selector in selectors:
-                    button = await self.page.query_selector(selector)
-                    if button:
-                        logger.info(f"Найдена кнопка отзывов с селектором: {selector}")
-                        return button
-                
-                # Если кнопка не найдена, пробуем искать по тексту на странице
-                try:
-                    button = await self.page.query_selector("text=Смотреть все отзывы")
-                    if button:
-                        logger.info("Найдена кнопка отзывов по тексту")
-                        return button
-                except:
-                    pass
-            
-            # Если кнопка не найдена, пробуем перейти на страницу отзывов напрямую
-            current_url = self.page.url
-            article_id = await self._get_article_from_url(current_url)
-            if article_id:
-                logger.info(f"Кнопка отзывов не найдена, пробуем перейти на страницу отзывов напрямую")
-                feedbacks_url = f"https://www.wildberries.ru/catalog/{article_id}/feedbacks"
-                await self.page.goto(feedbacks_url, wait_until="domcontentloaded")
-                await asyncio.sleep(3)
-                return True  # Возвращаем True, чтобы показать, что мы перешли на страницу отзывов
             
             logger.error("Кнопка 'Смотреть все отзывы' не найдена")
-            return None
+            return False
         except Exception as e:
             logger.error(f"Ошибка при поиске кнопки отзывов: {e}")
-            return None
+            return False
+
+    async def _open_feedbacks(self, article, product_url):
+        """Переход на страницу отзывов: сначала напрямую, затем через кнопку"""
+        feedbacks_url = f"{BASE_URL}/catalog/{article}/feedbacks"
+        logger.info(f"Переходим на страницу отзывов напрямую: {feedbacks_url}")
+        await self._goto(feedbacks_url)
+        if await self._wait_for_reviews(timeout=10000):
+            return True
+        
+        logger.warning("Прямой переход не показал отзывы, ищем кнопку на странице товара")
+        await self._goto(product_url)
+        if not await self._find_reviews_button():
+            return False
+        return await self._wait_for_reviews(timeout=10000)
 
     async def _click_this_variant_button(self):
         """Нажатие на кнопку 'Этот вариант товара'"""
         try:
             # Ждем появления кнопки с увеличенным таймаутом
             try:
-                await self.page.wait_for_selector("text='Этот вариант товара'", timeout=15000)
+                await self.page.wait_for_selector("text='Этот вариант товара'", timeout=self._timeout(15000))
             except TimeoutError:
                 logger.warning("Кнопка 'Этот вариант товара' не найдена за 15 секунд")
                 return False
@@ -259,78 +436,22 @@ class WildberriesParser:
         """Парсинг отзывов с текущей страницы"""
         try:
             # Ждем загрузки отзывов с увеличенным таймаутом
-            try:
-                await self.page.wait_for_function("""
-                    () => {
-                        const reviews = document.querySelectorAll('.feedback__content, .comment__content, .product-feedbacks__block');
-                        return reviews.length > 0;
-                    }
-                """, timeout=15000)
-            except TimeoutError:
+            if not await self._wait_for_reviews(timeout=15000):
                 logger.warning("Таймаут при ожидании загрузки отзывов, пробуем продолжить")
             
             # Прокручиваем страницу для загрузки всех отзывов (до 50)
             for _ in range(15):  # Увеличиваем количество прокруток
+                # При нехватке времени разбираем то, что уже загрузилось
+                if self._budget_low(SCROLL_RESERVE):
+                    logger.warning("Время запроса на исходе, прекращаем прокрутку отзывов")
+                    break
                 await self.page.evaluate("window.scrollBy(0, window.innerHeight)")
                 await asyncio.sleep(0.5)
             
             # Получаем HTML-содержимое страницы
             content = await self.page.content()
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Находим все блоки с отзывами, проверяя различные селекторы
-            review_blocks = soup.select('.feedback__content, .comment__content, .product-feedbacks__block')
-            
-            if not review_blocks:
-                logger.warning("Не найдены блоки с отзывами, пробуем альтернативные селекторы")
-                # Пробуем альтернативные селекторы
-                review_blocks = soup.select('.comments__item, .feedback, .feedbacks__item')
-            
-            logger.info(f"Найдено {len(review_blocks)} блоков с отзывами")
-            
-            advantages = []
-            disadvantages = []
-            comments = []
-            
-            for block in review_blocks[:50]:  # Ограничиваем до 50 отзывов
-                # Ищем блоки с достоинствами, недостатками и комментариями
-                # Проверяем различные варианты структуры отзывов
-                
-                # Вариант 1: Стандартная структура с выделенными блоками
-                text_items = block.select('.feedback__text--item, .comment__text--item')
-                
-                if text_items:
-                    for item in text_items:
-                        bold_text = item.select_one('.feedback__text--item-bold, .comment__text--item-bold')
-                        if not bold_text:
-                            # Если нет выделенного заголовка, это просто комментарий
-                            comments.append(item.get_text().strip())
-                            continue
-                        
-                        category = bold_text.get_text().strip()
-                        # Удаляем заголовок из текста
-                        text = item.get_text().replace(category, '', 1).strip()
-                        
-                        if "Достоинства" in category:
-                            advantages.append(text)
-                        elif "Недостатки" in category:
-                            disadvantages.append(text)
-                        elif "Комментарий" in category:
-                            comments.append(text)
-                else:
-                    # Вариант 2: Простая структура без выделенных блоков
-                    review_text = block.select_one('.feedback__text, .comment__text')
-                    if review_text:
-                        text = review_text.get_text().strip()
-                        if text:
-                            comments.append(text)
-            
-            logger.info(f"Собрано отзывов: достоинства - {len(advantages)}, недостатки - {len(disadvantages)}, комментарии - {len(comments)}")
-            return {
-                "advantages": advantages,
-                "disadvantages": disadvantages,
-                "comments": comments
-            }
+            self.last_payload = content
+            return self._extract_reviews(content)
         except TimeoutError:
             logger.error("Таймаут при ожидании загрузки отзывов")
             return {"advantages": [], "disadvantages": [], "comments": []}
@@ -338,76 +459,264 @@ class WildberriesParser:
             logger.error(f"Ошибка при парсинге отзывов: {e}")
             return {"advantages": [], "disadvantages": [], "comments": []}
 
-    async def _combine_reviews(self, reviews_data):
-        """Объединение отзывов по категориям"""
+    def _extract_reviews(self, content):
+        """
+        Извлечение отзывов из HTML страницы отзывов
+
+        Args:
+            content (str): HTML страницы (текущей или сохраненной в кеше)
+
+        Returns:
+            dict: Списки отзывов по категориям
+        """
+        soup = BeautifulSoup(content, 'html.parser')
+
+        # Находим все блоки с отзывами, проверяя различные селекторы
+        review_blocks = soup.select('.feedback__content, .comment__content, .product-feedbacks__block')
+
+        if not review_blocks:
+            logger.warning("Не найдены блоки с отзывами, пробуем альтернативные селекторы")
+            # Пробуем альтернативные селекторы
+            review_blocks = soup.select('.comments__item, .feedback, .feedbacks__item')
+
+        logger.info(f"Найдено {len(review_blocks)} блоков с отзывами")
+
+        advantages = []
+        disadvantages = []
+        comments = []
+
+        for block in review_blocks[:50]:  # Ограничиваем до 50 отзывов
+            # Ищем блоки с достоинствами, недостатками и комментариями
+            # Проверяем различные варианты структуры отзывов
+
+            # Вариант 1: Стандартная структура с выделенными блоками
+            text_items = block.select('.feedback__text--item, .comment__text--item')
+
+            if text_items:
+                for item in text_items:
+                    bold_text = item.select_one('.feedback__text--item-bold, .comment__text--item-bold')
+                    if not bold_text:
+                        # Если нет выделенного заголовка, это просто комментарий
+                        comments.append(item.get_text().strip())
+                        continue
+
+                    category = bold_text.get_text().strip()
+                    # Удаляем заголовок из текста
+                    text = item.get_text().replace(category, '', 1).strip()
+
+                    if "Достоинства" in category:
+                        advantages.append(text)
+                    elif "Недостатки" in category:
+                        disadvantages.append(text)
+                    elif "Комментарий" in category:
+                        comments.append(text)
+            else:
+                # Вариант 2: Простая структура без выделенных блоков
+                review_text = block.select_one('.feedback__text, .comment__text')
+                if review_text:
+                    text = review_text.get_text().strip()
+                    if text:
+                        comments.append(text)
+
+        logger.info(f"Собрано отзывов: достоинства - {len(advantages)}, недостатки - {len(disadvantages)}, комментарии - {len(comments)}")
+        return {
+            "advantages": advantages,
+            "disadvantages": disadvantages,
+            "comments": comments
+        }
+
+    async def _combine_reviews(self, clusters):
+        """Объединение нормализованных отзывов по категориям"""
         result = {}
         
-        # Объединяем достоинства
-        advantages = reviews_data.get("advantages", [])
-        if advantages:
-            combined_advantages = ""
-            for adv in advantages:
-                if adv.strip():
-                    # Добавляем точку и пробел, если нет знака пунктуации в конце
-                    if not adv[-1] in ['.', '!', '?']:
-                        combined_advantages += adv + ". "
-                    else:
-                        combined_advantages += adv + " "
-            result["advantages"] = combined_advantages.strip()
+        for key in ("advantages", "disadvantages", "comments"):
+            combined = ""
+            for cluster in clusters.get(key, []):
+                text = cluster["text"]
+                # Добавляем точку и пробел, если нет знака пунктуации в конце
+                if not text[-1] in ['.', '!', '?']:
+                    combined += text + ". "
+                else:
+                    combined += text + " "
+            if combined:
+                result[key] = combined.strip()
         
-        # Объединяем недостатки
-        disadvantages = reviews_data.get("disadvantages", [])
-        if disadvantages:
-            combined_disadvantages = ""
-            for dis in disadvantages:
-                if dis.strip():
-                    if not dis[-1] in ['.', '!', '?']:
-                        combined_disadvantages += dis + ". "
-                    else:
-                        combined_disadvantages += dis + " "
-            result["disadvantages"] = combined_disadvantages.strip()
+        return result
+
+    async def _load_product_info(self, article, product_url):
+        """Загрузка карточки товара на отдельной странице того же контекста"""
+        page = await self.context.new_page()
+        try:
+            logger.info(f"Открываем страницу товара: {product_url}")
+            await self._goto(product_url, page)
+            
+            # Ждем карточку товара вместо фиксированной паузы
+            try:
+                await page.wait_for_selector(", ".join(self.selectors.order["product_name"]), timeout=self._timeout(5000))
+            except TimeoutError:
+                logger.warning("Карточка товара не появилась за 5 секунд, продолжаем")
+            
+            # Эмулируем человеческое поведение для обхода защиты, если включено
+            if self.emulate_human:
+                await self._emulate_human_behavior(page)
+            
+            return await self._get_product_info(article, page)
+        except SiteBlocked:
+            # Блокировка прерывает весь парсинг, а не только карточку
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке карточки товара: {e}")
+            return {"product_name": "Неизвестный товар", "avg_rating": 0.0}
+        finally:
+            await page.close()
+
+    async def _load_feedbacks(self, article, product_url):
+        """Переход к отзывам и их сбор на основной странице"""
+        if not await self._open_feedbacks(article, product_url):
+            return None
         
-        # Объединяем комментарии
-        comments = reviews_data.get("comments", [])
-        if comments:
-            combined_comments = ""
-            for com in comments:
-                if com.strip():
-                    if not com[-1] in ['.', '!', '?']:
-                        combined_comments += com + ". "
-                    else:
-                        combined_comments += com + " "
-            result["comments"] = combined_comments.strip()
+        # Нажимаем на кнопку "Этот вариант товара", если фильтр включен и позволяет время
+        if self.variant_filter and not self._budget_low(SCROLL_RESERVE * 2):
+            self.variant_filtered = await self._click_this_variant_button()
         
-        return result
+        # Карточка известна по первому запросу отзывов: если ее отзывы уже
+        # проанализированы для другого варианта, прокрутка не нужна
+        key = self._reviews_key(article)
+        if key in self.known_keys:
+            logger.info(f"Отзывы {key} уже проанализированы, сбор отзывов пропущен")
+            self.reviews_shared = True
+            return {}
+        
+        # Парсим отзывы
+        return await self._parse_reviews()
 
-    async def _clean_emoji(self, text):
-        """Очистка текста от эмодзи"""
-        if not text:
-            return ""
+    def _reviews_key(self, article):
+        """
+        Ключ, под которым хранятся отзывы и результаты их анализа
+
+        Без фильтра по варианту отзывы общие для всей карточки, и ключ один для всех
+        ее вариантов. Если карточку определить не удалось или отзывы отфильтрованы,
+        ключом остается артикул.
+        """
+        if self.feedback_root and not self.variant_filtered:
+            return f"imt{self.feedback_root}"
+        return article
+
+    async def _build_result(self, article, product_info, reviews_data):
+        """Нормализация отзывов и формирование результата парсинга"""
+        # Нормализуем отзывы и схлопываем дубликаты
+        clusters = self.normalizer.normalize_reviews(reviews_data)
         
-        emoji_pattern = re.compile(
-            "["
-            "\U0001F600-\U0001F64F"  # эмодзи: смайлики
-            "\U0001F300-\U0001F5FF"  # эмодзи: разные символы и пиктограммы
-            "\U0001F680-\U0001F6FF"  # эмодзи: транспорт и символы
-            "\U0001F700-\U0001F77F"  # эмодзи: алхимические символы
-            "\U0001F780-\U0001F7FF"  # эмодзи: геометрические фигуры
-            "\U0001F800-\U0001F8FF"  # эмодзи: дополнительные стрелки
-            "\U0001F900-\U0001F9FF"  # эмодзи: дополнительные символы
-            "\U0001FA00-\U0001FA6F"  # эмодзи: расширенные символы
-            "\U0001FA70-\U0001FAFF"  # эмодзи: символы
-            "\U00002702-\U000027B0"  # эмодзи: разные символы
-            "\U000024C2-\U0001F251"  # эмодзи: заключенные символы
-            "]+", flags=re.UNICODE
-        )
-        return emoji_pattern.sub(r'', text)
+        # Объединяем отзывы по категориям
+        combined_reviews = await self._combine_reviews(clusters)
+        
+        # Формируем результат
+        return {
+            "article_id": article,
+            "reviews_key": self._reviews_key(article),
+            "feedback_root": self.feedback_root,
+            "variant_filtered": self.variant_filtered,
+            "product_name": product_info["product_name"],
+            "avg_rating": product_info["avg_rating"],
+            "advantages": combined_reviews.get("advantages", ""),
+            "disadvantages": combined_reviews.get("disadvantages", ""),
+            "comments": combined_reviews.get("comments", ""),
+            "clusters": clusters,
+            "review_counts": {
+                key: sum(cluster["count"] for cluster in items)
+                for key, items in clusters.items()
+            }
+        }
+
+    async def replay(self, article_or_url, max_age=None, reextract=False):
+        """
+        Результат парсинга из кеша сырых данных, без браузера и сети
+        
+        Args:
+            article_or_url (str): Артикул или ссылка на товар
+            max_age (float): Максимальный возраст записи в секундах (по умолчанию TTL кеша)
+            reextract (bool): Заново извлечь отзывы из сохраненного HTML страницы
+                (если он есть, см. CAPTURE_STORE_PAYLOAD), например после правки селекторов
+            
+        Returns:
+            dict: Данные отзывов в формате parse() или None, если в кеше их нет
+        """
+        article = await self._get_article_from_url(article_or_url)
+        capture = self.capture_cache.get(article, max_age=max_age) if article else None
+        if not capture:
+            logger.info(f"В кеше нет сырых данных для {article_or_url}")
+            return None
+        
+        self.feedback_root = capture.get("feedback_root")
+        self.variant_filtered = capture.get("variant_filtered", False)
+        # Общая запись карточки хранит только отзывы, название и рейтинг - в ссылке варианта
+        info = self.capture_cache.get_info(article) or capture
+        product_info = {"product_name": info["product_name"], "avg_rating": info["avg_rating"]}
+        
+        reviews_data = capture["reviews"]
+        if reextract:
+            payload = self.capture_cache.get_payload(article)
+            if payload:
+                reviews_data = self._extract_reviews(payload)
+            else:
+                logger.info(f"HTML страницы отзывов {article} не сохранен, берем извлеченные отзывы")
+        return await self._build_result(article, product_info, reviews_data)
 
-    async def parse(self, article_or_url):
-        """Основной метод парсинга отзывов"""
+    @classmethod
+    async def parse_many(cls, articles_or_urls, deadline=None):
+        """
+        Параллельный парсинг нескольких товаров в одном браузере, у каждого свой контекст
+        
+        Args:
+            articles_or_urls (list): Артикулы или ссылки на товары
+            deadline (Deadline): Крайний срок парсинга
+            
+        Returns:
+            list: Результаты parse() в порядке входных товаров (None для неудачных)
+        """
+        # Пока сайт блокирует запросы, браузер не запускаем
+        rate_limiter.check()
+        
+        browser = await cls()._launch_browser()
+        try:
+            results = await asyncio.gather(
+                *(cls().parse(article, browser=browser, deadline=deadline) for article in articles_or_urls),
+                return_exceptions=True
+            )
+        finally:
+            await browser.close()
+            logger.info("Общий браузер закрыт")
+        
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for article, result in zip(articles_or_urls, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Парсинг {article} в общем браузере не удался: {result}")
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        return [None if isinstance(r, BaseException) else r for r in results]
+
+    async def parse(self, article_or_url, browser=None, deadline=None, known_keys=None):
+        """
+        Основной метод парсинга отзывов
+        
+        Args:
+            article_or_url (str): Артикул или ссылка на товар
+            browser: Общий браузер для параллельного парсинга (по умолчанию запускается свой)
+            deadline (Deadline): Крайний срок; ожидания на странице ограничиваются им,
+                а при нехватке времени разбираются уже загруженные отзывы
+            known_keys (set): Ключи отзывов с готовым результатом анализа; для них
+                отзывы не собираются, а результат содержит только карточку и ключ
+                с признаком reviews_shared
+        """
+        self.deadline = deadline
+        self.known_keys = set(known_keys or ())
+        article = None
         try:
+            # Пока сайт блокирует запросы, браузер не запускаем
+            rate_limiter.check()
+            
             # Инициализация браузера
-            await self._init_browser()
+            await self._init_browser(browser)
             
             # Получаем артикул и URL товара
             article = await self._get_article_from_url(article_or_url)
@@ -417,65 +726,71 @@ class WildberriesParser:
             
             product_url = await self._get_product_url(article)
             
-            # Открываем страницу товара
-            logger.info(f"Открываем страницу товара: {product_url}")
-            await self.page.goto(product_url, wait_until="domcontentloaded")
-            await asyncio.sleep(5)  # Увеличиваем время ожидания загрузки
-            
-            # Эмулируем человеческое поведение для обхода защиты
-            await self._emulate_human_behavior()
-            
-            # Получаем информацию о товаре
-            product_info = await self._get_product_info(article)
-            
-            # Ищем и нажимаем на кнопку "Смотреть все отзывы"
-            reviews_button = await self._find_reviews_button()
-            
-            if not reviews_button:
+            # Карточка товара и отзывы грузятся параллельно на двух страницах;
+            # ошибку одной страницы пробрасываем, только когда вторая тоже завершилась,
+            # чтобы не закрыть контекст под работающей страницей
+            product_info, reviews_data = await asyncio.gather(
+                self._load_product_info(article, product_url),
+                self._load_feedbacks(article, product_url),
+                return_exceptions=True
+            )
+            for outcome in (product_info, reviews_data):
+                if isinstance(outcome, BaseException):
+                    raise outcome
+            
+            if reviews_data is None:
                 logger.error("Не удалось найти или перейти на страницу отзывов")
                 return None
             
-            # Если reviews_button не является True (т.е. мы не перешли напрямую на страницу отзывов)
-            if reviews_button is not True:
-                # Нажимаем на кнопку отзывов
-                logger.info("Нажимаем на кнопку 'Смотреть все отзывы'")
-                await reviews_button.click()
-                await asyncio.sleep(5)  # Увеличиваем время ожидания загрузки
-            
-            # Нажимаем на кнопку "Этот вариант товара", если она есть
-            await self._click_this_variant_button()
-            
-            # Парсим отзывы
-            reviews_data = await self._parse_reviews()
-            
-            # Объединяем отзывы по категориям
-            combined_reviews = await self._combine_reviews(reviews_data)
-            
-            # Очищаем от эмодзи
-            for key in combined_reviews:
-                combined_reviews[key] = await self._clean_emoji(combined_reviews[key])
-            
-            # Формируем результат
-            result = {
-                "article_id": article,
-                "product_name": product_info["product_name"],
-                "avg_rating": product_info["avg_rating"],
-                "advantages": combined_reviews.get("advantages", ""),
-                "disadvantages": combined_reviews.get("disadvantages", ""),
-                "comments": combined_reviews.get("comments", "")
+            key = self._reviews_key(article)
+            if self.reviews_shared:
+                # Отзывы не собирались: запоминаем только вариант для повтора из кеша
+                self.capture_cache.link(article, key, info={"article_id": article, **product_info})
+                logger.info(f"Парсинг {article} завершен без сбора отзывов, они общие с {key}")
+                return {
+                    "article_id": article,
+                    "reviews_key": key,
+                    "feedback_root": self.feedback_root,
+                    "variant_filtered": self.variant_filtered,
+                    "reviews_shared": True,
+                    **product_info
+                }
+            
+            # Сохраняем сырые данные для повторного анализа без обращения к сайту:
+            # общие отзывы карточки - один раз, а название и рейтинг варианта - в его ссылке
+            capture = {
+                "reviews": reviews_data,
+                "feedback_root": self.feedback_root, "variant_filtered": self.variant_filtered
             }
+            if key == article:
+                capture.update({"article_id": article, **product_info})
+            self.capture_cache.put(key, capture, payload=self.last_payload)
+            if key != article:
+                self.capture_cache.link(article, key, info={"article_id": article, **product_info})
+            
+            result = await self._build_result(article, product_info, reviews_data)
             
             logger.info(f"Парсинг завершен успешно для артикула {article}")
             return result
             
+        except SiteBlocked as e:
+            # Пробрасываем, чтобы пользователь получил понятную причину отказа
+            logger.warning(f"Парсинг {article_or_url} отклонен: {e}")
+            raise
         except Exception as e:
             logger.error(f"Ошибка при парсинге: {e}")
             return None
         finally:
-            # Закрываем браузер
-            if self.browser:
+            # Сохраняем статистику трафика
+            if self.request_filter and article:
+                await self.request_filter.record(article)
+            
+            # Закрываем браузер, а общий оставляем остальным товарам
+            if self.browser and self.owns_browser:
                 await self.browser.close()
                 logger.info("Браузер закрыт")
+            elif self.context:
+                await self.context.close()
 
 # Для тестирования
 async def main():
@@ -486,6 +801,8 @@ async def main():
 
 if __name__ == "__main__":
     import sys
+    from log_setup import setup_logging
+    setup_logging("parser.log")
     if len(sys.argv) > 1:
         article = sys.argv[1]
         asyncio.run(WildberriesParser().parse(article))
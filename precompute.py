@@ -0,0 +1,338 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import collections
+
+from log_setup import request_id
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def article_from_text(text):
+    """Артикул из ссылки на товар или сообщения с артикулом (None, если его нет)"""
+    match = re.search(r"catalog/(\d+)/", text)
+    if match:
+        return match.group(1)
+    return text if text.isdigit() else None
+
+
+def is_complete(analysis):
+    """Результат анализа можно кешировать: категории есть и у каждой готова суммаризация"""
+    analyzed_data = (analysis or {}).get("analyzed_data")
+    return bool(analyzed_data) and all(item["summary"] for item in analyzed_data)
+
+
+class ResultCache:
+    """
+    Готовые результаты анализа товаров в памяти бота
+
+    Результаты хранятся по ключу отзывов из парсера, поэтому варианты товара
+    с общими отзывами получают один результат. Для каждого артикула
+    запоминаются только его ключ, название и рейтинг.
+    """
+
+    def __init__(self, ttl=None):
+        """
+        Args:
+            ttl (float): Сколько секунд результат считается свежим (по умолчанию из RESULT_CACHE_TTL, 3600)
+        """
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESULT_CACHE_TTL", "3600"))
+        self._entries = {}  # ключ отзывов -> (время расчета, данные отзывов, результат анализа)
+        self._variants = {}  # артикул -> ключ отзывов, название и рейтинг этого артикула
+
+    def _remember_variant(self, article, reviews):
+        """Запоминание ключа отзывов и карточки артикула"""
+        self._variants[article] = {
+            "article_id": article,
+            "reviews_key": reviews.get("reviews_key") or article,
+            "product_name": reviews.get("product_name"),
+            "avg_rating": reviews.get("avg_rating")
+        }
+
+    def _entry(self, article):
+        """Свежая запись для артикула (None, если ее нет или она устарела)"""
+        variant = self._variants.get(article)
+        key = variant["reviews_key"] if variant else article
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        return entry
+
+    def prune(self):
+        """
+        Удаление устаревших результатов и артикулов, которым больше нечего отдавать
+
+        Returns:
+            int: Количество удаленных результатов
+        """
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if now - entry[0] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        for article in [a for a, variant in self._variants.items() if variant["reviews_key"] not in self._entries]:
+            del self._variants[article]
+        return len(expired)
+
+    def put(self, article, reviews, analysis):
+        """Сохранение результата, рассчитанного только что"""
+        if self.ttl > 0:
+            # Без очистки записи о товарах, которые больше не запрашивают, копились бы бесконечно
+            self.prune()
+            self._remember_variant(article, reviews)
+            self._entries[reviews.get("reviews_key") or article] = (time.time(), reviews, analysis)
+
+    def get(self, article):
+        """
+        Свежий результат для товара
+
+        Returns:
+            tuple: (данные отзывов, результат анализа) или None, если результата нет или он устарел
+        """
+        entry = self._entry(article)
+        if entry is None:
+            return None
+        # Отзывы и анализ общие, название и рейтинг - своего варианта
+        variant = self._variants.get(article, {})
+        return {**entry[1], **variant}, entry[2]
+
+    def get_shared(self, article, reviews):
+        """
+        Результат, уже посчитанный для другого варианта с теми же отзывами
+
+        Args:
+            article (str): Артикул из запроса
+            reviews (dict): Только что собранные отзывы с ключом отзывов
+
+        Returns:
+            dict: Результат анализа или None, если его нет
+        """
+        if self.ttl <= 0:
+            return None
+        self._remember_variant(article, reviews)
+        entry = self._entry(article)
+        return entry[2] if entry else None
+
+    def fresh_keys(self, min_ttl=0.0):
+        """
+        Ключи отзывов, результаты которых останутся свежими еще min_ttl секунд
+
+        По ним парсер пропускает сбор отзывов, уже проанализированных для другого
+        варианта; запас min_ttl гарантирует, что результат доживет до конца запроса.
+        """
+        now = time.time()
+        return {key for key, entry in self._entries.items() if entry[0] + self.ttl - now >= min_ttl}
+
+    def expires_in(self, article):
+        """Через сколько секунд результат устареет (0, если его нет)"""
+        entry = self._entry(article)
+        if entry is None:
+            return 0.0
+        return max(0.0, entry[0] + self.ttl - time.time())
+
+
+class Precomputer:
+    """
+    Фоновый пересчет самых запрашиваемых товаров
+
+    Частота запросов считается с экспоненциальным затуханием. Пока бот
+    простаивает, результаты top-N товаров пересчитываются до того, как
+    устареют. Фоновая задача занимает один обработчик, укладывается в
+    бюджет времени обработки за час и отменяется при первом живом запросе.
+    """
+
+    def __init__(self, pool, cache, top_n=None, budget=None, refresh_margin=None, idle_delay=None,
+                 half_life=None, min_score=1.5, interval=5.0, capture_cache=None, purge_interval=3600.0):
+        """
+        Args:
+            pool (WorkerPool): Пул обработчиков, в который отправляются задачи
+            cache (ResultCache): Кеш готовых результатов
+            top_n (int): Сколько самых запрашиваемых товаров держать свежими
+                (по умолчанию из PRECOMPUTE_TOP_N, 20; 0 - выключено)
+            budget (float): Секунд работы обработчика на фоновые задачи за час
+                (по умолчанию из PRECOMPUTE_BUDGET, 600)
+            refresh_margin (float): За сколько секунд до устаревания пересчитывать результат
+                (по умолчанию из PRECOMPUTE_MARGIN, 600)
+            idle_delay (float): Сколько секунд без живых запросов считается простоем
+                (по умолчанию из PRECOMPUTE_IDLE, 30)
+            half_life (float): Период полураспада счетчика запросов в секундах
+                (по умолчанию из PRECOMPUTE_HALF_LIFE, сутки)
+            min_score (float): Минимальный вес товара для пересчета (больше одного запроса)
+            interval (float): Период проверки в секундах
+            capture_cache (CaptureCache): Кеш сырых данных, устаревшие записи которого
+                удаляются в простое (None - не очищать)
+            purge_interval (float): Период очистки кеша сырых данных в секундах
+        """
+        self.pool = pool
+        self.cache = cache
+        self.top_n = top_n if top_n is not None else int(os.getenv("PRECOMPUTE_TOP_N", "20"))
+        self.budget = budget if budget is not None else float(os.getenv("PRECOMPUTE_BUDGET", "600"))
+        self.refresh_margin = (
+            refresh_margin if refresh_margin is not None else float(os.getenv("PRECOMPUTE_MARGIN", "600"))
+        )
+        self.idle_delay = idle_delay if idle_delay is not None else float(os.getenv("PRECOMPUTE_IDLE", "30"))
+        self.half_life = (
+            half_life if half_life is not None else float(os.getenv("PRECOMPUTE_HALF_LIFE", str(24 * 3600)))
+        )
+        self.min_score = min_score
+        self.interval = interval
+        self.capture_cache = capture_cache
+        self.purge_interval = purge_interval
+        self._purged_at = None
+
+        self._scores = {}  # артикул -> (вес, время обновления)
+        self._failed_at = {}  # артикул -> время неудачного пересчета, пока не прошел refresh_margin
+        self._spent = collections.deque()  # (время окончания, длительность) фоновых задач
+        self._live = 0
+        self._last_live = time.monotonic()
+        self._job = None
+        self._runner = None
+
+    def record(self, article):
+        """Учет запроса товара"""
+        now = time.monotonic()
+        self._scores[article] = (self._score(article, now) + 1.0, now)
+
+    def _score(self, article, now):
+        """Вес товара с учетом затухания"""
+        score, updated_at = self._scores.get(article, (0.0, now))
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def top(self):
+        """
+        Самые запрашиваемые товары
+
+        Returns:
+            list: Пары (артикул, вес) по убыванию веса, не более top_n
+        """
+        now = time.monotonic()
+        scores = [(article, self._score(article, now)) for article in self._scores]
+        scores.sort(key=lambda item: item[1], reverse=True)
+
+        # Товары, о которых почти забыли, больше не храним
+        for article, score in scores[self.top_n * 10:]:
+            if score < 0.01:
+                del self._scores[article]
+        return scores[:self.top_n]
+
+    def begin_live(self):
+        """Начало живого запроса: фоновая задача уступает обработчик"""
+        self._live += 1
+        if self._job is not None and not self._job.done():
+            logger.info("Фоновый пересчет прерван живым запросом")
+            self._job.cancel()
+
+    def end_live(self):
+        """Завершение живого запроса"""
+        self._live = max(0, self._live - 1)
+        self._last_live = time.monotonic()
+
+    def _idle(self):
+        """Живых запросов нет уже idle_delay секунд"""
+        return self._live == 0 and time.monotonic() - self._last_live >= self.idle_delay
+
+    def _budget_left(self):
+        """Остаток бюджета фоновой обработки за последний час в секундах"""
+        now = time.monotonic()
+        while self._spent and now - self._spent[0][0] > 3600:
+            self._spent.popleft()
+        return self.budget - sum(duration for _, duration in self._spent)
+
+    def _next_article(self):
+        """Самый запрашиваемый товар, результат которого скоро устареет"""
+        now = time.monotonic()
+        # Неудачи старше запаса до устаревания больше ничего не откладывают
+        for article in [a for a, failed_at in self._failed_at.items() if now - failed_at >= self.refresh_margin]:
+            del self._failed_at[article]
+        for article, score in self.top():
+            if score < self.min_score:
+                break
+            # Неудачный товар не пробуем снова, пока не пройдет запас до устаревания
+            if now - self._failed_at.get(article, -self.refresh_margin) < self.refresh_margin:
+                continue
+            if self.cache.expires_in(article) <= self.refresh_margin:
+                return article
+        return None
+
+    async def _refresh(self, article):
+        """Пересчет результата товара в полном качестве, без крайнего срока"""
+        started = time.monotonic()
+        request_id.set(f"precompute-{article}")
+        try:
+            logger.info(f"Фоновый пересчет товара {article}")
+            reviews = await self.pool.submit("parse", article)
+            if not reviews:
+                logger.warning(f"Фоновый пересчет {article}: отзывы не получены")
+                self._failed_at[article] = time.monotonic()
+                return
+            analysis = await self.pool.submit("analyze", reviews)
+            if not is_complete(analysis):
+                logger.warning(f"Фоновый пересчет {article}: анализ неполный, результат не сохранен")
+                self._failed_at[article] = time.monotonic()
+                return
+            self.cache.put(article, reviews, analysis)
+            self._failed_at.pop(article, None)
+            logger.info(f"Фоновый пересчет {article} завершен за {time.monotonic() - started:.1f} с")
+        except Exception as e:
+            logger.warning(f"Фоновый пересчет {article} не удался: {e}")
+            self._failed_at[article] = time.monotonic()
+        finally:
+            self._spent.append((time.monotonic(), time.monotonic() - started))
+
+    def _enabled(self):
+        """Фоновый пересчет включен и его результаты есть где хранить"""
+        return self.top_n > 0 and self.cache.ttl > 0
+
+    async def _purge_captures(self):
+        """Очистка кеша сырых данных не чаще раза в purge_interval"""
+        if self.capture_cache is None:
+            return
+        now = time.monotonic()
+        if self._purged_at is not None and now - self._purged_at < self.purge_interval:
+            return
+        self._purged_at = now
+        try:
+            # Обход каталога кеша не должен блокировать event loop
+            await asyncio.to_thread(self.capture_cache.purge)
+        except OSError as e:
+            logger.warning(f"Очистка кеша сырых данных не удалась: {e}")
+
+    async def _run(self):
+        """Цикл фонового пересчета и обслуживания кешей"""
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._idle():
+                continue
+            self.cache.prune()
+            await self._purge_captures()
+            if not self._enabled() or self._budget_left() <= 0:
+                continue
+            article = self._next_article()
+            if article is None:
+                continue
+
+            self._job = asyncio.create_task(self._refresh(article))
+            # Ждем через wait: отмена задачи живым запросом не должна остановить цикл
+            await asyncio.wait({self._job})
+            if self._job.cancelled():
+                logger.info(f"Фоновый пересчет {article} отложен")
+            self._job = None
+
+    def start(self):
+        """Запуск фонового пересчета"""
+        if self._enabled() or self.capture_cache is not None:
+            self._runner = asyncio.create_task(self._run())
+        if self._enabled():
+            logger.info(f"Фоновый пересчет включен: top-{self.top_n}, бюджет {self.budget:.0f} с/ч")
+
+    async def stop(self):
+        """Остановка фонового пересчета"""
+        for task in (self._runner, self._job):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.wait({task})
@@ -0,0 +1,188 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import multiprocessing
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Коды ответа, которыми маркетплейс сообщает об ограничении запросов
+BLOCK_STATUSES = {403, 429, 498}
+
+# Фрагменты заголовка и текста антибот-страниц
+BLOCK_PAGE_MARKERS = ("Почти готово", "Подозрительная активность", "Доступ ограничен")
+
+# Проверка открытой страницы на признаки антибот-заглушки за один запрос
+BLOCK_PAGE_JS = """
+(markers) => {
+    const text = (document.title + " " + (document.body ? document.body.innerText.slice(0, 2000) : "")).toLowerCase();
+    return markers.find((marker) => text.includes(marker.toLowerCase())) || null;
+}
+"""
+
+# Поля разделяемого состояния
+_TOKENS, _UPDATED_AT, _PAUSED_UNTIL, _FAILURES, _OPEN_UNTIL, _TRIAL_OWNER = range(6)
+
+
+class SiteBlocked(Exception):
+    """Сайт блокирует запросы, обращение отклонено без попытки"""
+
+
+class RateLimiter:
+    """
+    Общий для всех процессов ограничитель запросов к маркетплейсу
+
+    Маркерное ведро задает устойчивый темп, блокировки включают паузу
+    с экспоненциальной задержкой и разбросом, а серия блокировок подряд
+    размыкает цепь: запросы отклоняются сразу до окончания охлаждения.
+    """
+
+    def __init__(self, rate=None, burst=None, backoff_base=2.0, backoff_max=None,
+                 failure_threshold=None, cooldown=None):
+        """
+        Args:
+            rate (float): Запросов в секунду (по умолчанию из PARSER_RATE_LIMIT, 0.5)
+            burst (int): Размер ведра (по умолчанию из PARSER_RATE_BURST, 3)
+            backoff_base (float): Начальная пауза после блокировки в секундах
+            backoff_max (float): Максимальная пауза (по умолчанию из PARSER_BACKOFF_MAX, 120)
+            failure_threshold (int): Блокировок подряд до размыкания цепи
+                (по умолчанию из PARSER_CIRCUIT_THRESHOLD, 5)
+            cooldown (float): Время разомкнутой цепи в секундах (по умолчанию из PARSER_CIRCUIT_COOLDOWN, 300)
+        """
+        self.rate = rate if rate is not None else float(os.getenv("PARSER_RATE_LIMIT", "0.5"))
+        self.burst = burst if burst is not None else int(os.getenv("PARSER_RATE_BURST", "3"))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv("PARSER_BACKOFF_MAX", "120"))
+        self.failure_threshold = (
+            failure_threshold if failure_threshold is not None
+            else int(os.getenv("PARSER_CIRCUIT_THRESHOLD", "5"))
+        )
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("PARSER_CIRCUIT_COOLDOWN", "300"))
+
+        # Состояние в разделяемой памяти, чтобы процессы-обработчики делили одно ведро.
+        # Контекст spawn совпадает с контекстом пула, time.monotonic в Linux общий для процессов
+        self.state = multiprocessing.get_context("spawn").Array("d", 6)
+        self.state[_TOKENS] = self.burst
+        self.state[_UPDATED_AT] = time.monotonic()
+
+    def use_state(self, state):
+        """Подключение к состоянию, созданному в родительском процессе"""
+        self.state = state
+
+    def _refill(self, now):
+        """Пополнение ведра за прошедшее время (вызывается под блокировкой)"""
+        state = self.state
+        if self.rate > 0:
+            elapsed = max(0.0, now - state[_UPDATED_AT])
+            state[_TOKENS] = min(self.burst, state[_TOKENS] + elapsed * self.rate)
+        state[_UPDATED_AT] = now
+
+    def new_owner(self):
+        """Идентификатор для запросов одного парсинга, которые делят пробный запрос"""
+        return float(random.getrandbits(52) or 1)
+
+    def check(self, owner=None):
+        """
+        Исключение SiteBlocked, если цепь разомкнута
+
+        Args:
+            owner (float): Идентификатор парсинга; пробный запрос полуразомкнутой цепи
+                пропускает запросы своего парсинга
+        """
+        now = time.monotonic()
+        open_until = self.state[_OPEN_UNTIL]
+        if now < open_until and not (owner and self.state[_TRIAL_OWNER] == owner):
+            raise SiteBlocked(
+                f"Сайт ограничивает запросы, повторите через {int(open_until - now) + 1} с"
+            )
+
+    async def acquire(self, owner=None, deadline=None):
+        """
+        Ожидание разрешения на запрос
+
+        Args:
+            owner (float): Идентификатор парсинга из new_owner(); страницы одного
+                парсинга (карточка и отзывы) проходят пробный период вместе
+            deadline (Deadline): Крайний срок запроса; ожидание дольше оставшегося
+                времени не начинается
+
+        Raises:
+            SiteBlocked: Цепь разомкнута или пауза ограничителя не укладывается в срок,
+                запрос не выполняется
+        """
+        with self.state.get_lock():
+            now = time.monotonic()
+            self.check(owner)
+            trial = self.state[_FAILURES] >= self.failure_threshold and now >= self.state[_OPEN_UNTIL]
+            if trial:
+                # Охлаждение закончилось: пропускаем один пробный парсинг,
+                # запросы остальных отклоняются до его результата
+                self.state[_OPEN_UNTIL] = now + self.cooldown
+                self.state[_TRIAL_OWNER] = owner or 0.0
+                logger.info("Цепь полуразомкнута, выполняется пробный запрос")
+
+            # Маркер резервируется сразу, уход в минус означает очередь ожидающих
+            self._refill(now)
+            self.state[_TOKENS] -= 1
+            delay = 0.0 if self.rate <= 0 else max(0.0, -self.state[_TOKENS] / self.rate)
+            delay = max(delay, self.state[_PAUSED_UNTIL] - now)
+
+            if deadline is not None and delay > deadline.remaining():
+                # Запрос все равно не успеет: возвращаем маркер и отказываем сразу,
+                # а пробный запрос оставляем следующему парсингу
+                self.state[_TOKENS] += 1
+                if trial:
+                    self.state[_OPEN_UNTIL] = now
+                    self.state[_TRIAL_OWNER] = 0.0
+                raise SiteBlocked(
+                    f"Сайт ограничивает запросы, повторите через {int(delay) + 1} с"
+                )
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def report_success(self):
+        """Запрос прошел без блокировки"""
+        with self.state.get_lock():
+            if self.state[_FAILURES]:
+                logger.info("Блокировка снята, ограничитель возвращен в обычный режим")
+            self.state[_FAILURES] = 0
+            self.state[_OPEN_UNTIL] = 0.0
+            self.state[_TRIAL_OWNER] = 0.0
+
+    def report_block(self, reason):
+        """
+        Регистрация блокировки: пауза с экспоненциальной задержкой и разбросом
+
+        Args:
+            reason (str): Признак блокировки для лога (код ответа или маркер страницы)
+        """
+        with self.state.get_lock():
+            now = time.monotonic()
+            # Параллельные запросы одной волны блокировок считаются одним событием
+            if now < self.state[_PAUSED_UNTIL]:
+                return
+
+            failures = int(self.state[_FAILURES]) + 1
+            self.state[_FAILURES] = failures
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+            backoff = random.uniform(backoff / 2, backoff)
+            self.state[_PAUSED_UNTIL] = now + backoff
+            # Запросы, накопленные до блокировки, не должны уйти разом после паузы
+            self.state[_TOKENS] = min(self.state[_TOKENS], 0.0)
+
+            if failures >= self.failure_threshold:
+                self.state[_OPEN_UNTIL] = now + self.cooldown
+                self.state[_TRIAL_OWNER] = 0.0
+                logger.error(
+                    f"Блокировка ({reason}) {failures} раз подряд, "
+                    f"запросы отклоняются {int(self.cooldown)} с"
+                )
+            else:
+                logger.warning(f"Блокировка ({reason}), пауза {backoff:.1f} с (попытка {failures})")
+
+
+# Общий ограничитель процесса; процессы пула подключаются к состоянию родителя
+rate_limiter = RateLimiter()
@@ -0,0 +1,160 @@
+import os
+import csv
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Типы ресурсов, без которых не работает страница отзывов
+ALLOWED_RESOURCE_TYPES = {"document", "script", "xhr", "fetch"}
+
+# Адрес сайта маркетплейса; для нагрузочного теста подменяется локальным сервером
+BASE_URL = os.getenv("PARSER_BASE_URL", "https://www.wildberries.ru").rstrip("/")
+
+# Домены маркетплейса, с которых грузятся страница, скрипты и API отзывов
+ALLOWED_ORIGINS = ("wildberries.ru", "wb.ru", "wbbasket.ru", "wbstatic.net", "wbcontent.net",
+                   urlsplit(BASE_URL).hostname)
+
+# Скрипты и запросы с разрешенных доменов, которые не нужны для сбора отзывов
+DEFAULT_BLOCKLIST = (
+    "analytics",
+    "metrika",
+    "tracker",
+    "counter",
+    "/adv/",
+    "banner",
+    "recommend",
+    "recom.",
+    "similar",
+    "popups",
+    "captcha-stat",
+    "sentry",
+)
+
+# Старые правила блокировки, действуют при выключенном фильтре
+LEGACY_BLOCK_PATTERNS = ("**/*.{png,jpg,jpeg,gif,svg,woff,woff2}", "**/analytics.js")
+
+
+class TrafficStats:
+    """Счетчики запросов и трафика одного парсинга"""
+
+    def __init__(self, filter_enabled):
+        self.filter_enabled = filter_enabled
+        self.requests = 0
+        self.blocked = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+
+    def as_dict(self):
+        """Статистика в виде словаря"""
+        return {
+            "filter": self.filter_enabled,
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "seconds": round(time.monotonic() - self.started_at, 2)
+        }
+
+
+class RequestFilter:
+    """Фильтр запросов браузера по списку разрешенных доменов и типов ресурсов"""
+
+    def __init__(self, enabled=None, blocklist=None, stats_path=os.path.join("data", "traffic_stats.csv")):
+        """
+        Args:
+            enabled (bool): Включить фильтр (по умолчанию из PARSER_REQUEST_FILTER, включен)
+            blocklist (list): Дополнительные подстроки URL для блокировки
+                (по умолчанию из PARSER_BLOCKLIST через запятую)
+            stats_path (str): CSV-файл со статистикой трафика по артикулам
+        """
+        if enabled is None:
+            enabled = os.getenv("PARSER_REQUEST_FILTER", "1") == "1"
+        if blocklist is None:
+            blocklist = [p.strip() for p in os.getenv("PARSER_BLOCKLIST", "").split(",") if p.strip()]
+
+        self.enabled = enabled
+        self.blocklist = tuple(DEFAULT_BLOCKLIST) + tuple(blocklist)
+        self.stats_path = stats_path
+        self.stats = TrafficStats(enabled)
+        self._pending = set()
+
+    def allows(self, url, resource_type):
+        """Нужен ли запрос для сбора отзывов"""
+        if resource_type not in ALLOWED_RESOURCE_TYPES:
+            return False
+        host = urlsplit(url).hostname or ""
+        if not any(host == origin or host.endswith("." + origin) for origin in ALLOWED_ORIGINS):
+            return False
+        lowered = url.lower()
+        return not any(pattern in lowered for pattern in self.blocklist)
+
+    async def _route(self, route):
+        """Обработчик перехвата запросов"""
+        request = route.request
+        if self.allows(request.url, request.resource_type):
+            await route.continue_()
+        else:
+            self.stats.blocked += 1
+            await route.abort()
+
+    async def _account(self, request):
+        """Учет объема завершенного запроса"""
+        try:
+            sizes = await request.sizes()
+            self.stats.bytes += sizes["responseHeadersSize"] + sizes["responseBodySize"]
+        except Exception:
+            pass  # Страница закрыта до получения размеров
+
+    def _on_finished(self, request):
+        """Счетчик завершенных запросов"""
+        self.stats.requests += 1
+        task = asyncio.ensure_future(self._account(request))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _on_failed(self, request):
+        """Счетчик запросов, завершившихся ошибкой сети"""
+        # Заблокированные фильтром запросы тоже приходят как failed, их уже посчитали
+        if request.failure and "ERR_FAILED" not in request.failure:
+            self.stats.failed += 1
+
+    async def attach(self, context):
+        """Подключение фильтра и счетчиков к контексту браузера"""
+        if self.enabled:
+            await context.route("**/*", self._route)
+        else:
+            for pattern in LEGACY_BLOCK_PATTERNS:
+                await context.route(pattern, lambda route: route.abort())
+        context.on("requestfinished", self._on_finished)
+        context.on("requestfailed", self._on_failed)
+
+    async def record(self, article_id):
+        """
+        Сохранение статистики трафика артикула
+
+        Returns:
+            dict: Статистика трафика
+        """
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        stats = self.stats.as_dict()
+        logger.info(f"Трафик артикула {article_id}: {stats}")
+
+        file_exists = os.path.isfile(self.stats_path)
+        try:
+            with open(self.stats_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f, delimiter=";")
+                if not file_exists:
+                    writer.writerow(["Время", "Артикул", "Фильтр", "Запросы", "Заблокировано", "Ошибки", "Байты", "Секунды"])
+                writer.writerow([
+                    time.strftime("%Y-%m-%d %H:%M:%S"), article_id, int(stats["filter"]),
+                    stats["requests"], stats["blocked"], stats["failed"], stats["bytes"], stats["seconds"]
+                ])
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить статистику трафика: {e}")
+        return stats
@@ -0,0 +1,72 @@
+import os
+import csv
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+HEADER = [
+    "№", "Артикул", "Средняя оценка", "Тип отзыва",
+    "Исходный отзыв", "Оценка", "Уровень уверенности",
+    "Автосуммаризация", "Эталон"
+]
+
+
+class ReviewStore:
+    """Хранилище результатов анализа в CSV-файлах по артикулам"""
+
+    def __init__(self, data_dir="data"):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def path_for(self, article_id):
+        """Путь к CSV-файлу артикула"""
+        return os.path.join(self.data_dir, f"reviews_data_{article_id}.csv")
+
+    def append(self, article_id, avg_rating, analyzed_data, reviews_key=None):
+        """
+        Дописывание результатов анализа в CSV-файл артикула
+
+        Args:
+            article_id (str): Артикул товара
+            avg_rating (float): Средняя оценка
+            analyzed_data (list): Результаты анализа по категориям
+            reviews_key (str): Ключ отзывов из парсера; варианты товара с общими
+                отзывами пишутся в один файл (по умолчанию артикул)
+
+        Returns:
+            str: Путь к CSV-файлу
+        """
+        csv_path = self.path_for(reviews_key or article_id)
+        file_exists = os.path.isfile(csv_path)
+
+        # Определяем номер строки
+        row_num = 1
+        if file_exists:
+            with open(csv_path, 'r', encoding='utf-8') as f:
+                row_num = sum(1 for _ in f)  # Заголовок + уже записанные строки
+
+        with open(csv_path, mode='a' if file_exists else 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file, delimiter=';')
+
+            # Записываем заголовок, если файл новый
+            if not file_exists:
+                writer.writerow(HEADER)
+
+            # Записываем данные
+            for data in analyzed_data:
+                writer.writerow([
+                    row_num,
+                    article_id,
+                    avg_rating,
+                    data["category"],
+                    data["text"],
+                    data["sentiment"],
+                    data["confidence"],
+                    data["summary"],
+                    ""  # Эталон (пустой)
+                ])
+                row_num += 1
+
+        logger.info(f"Сохранено {len(analyzed_data)} строк анализа в {csv_path}")
+        return csv_path
@@ -0,0 +1,225 @@
+import re
+import zlib
+import random
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Шаблоны компилируются один раз при импорте модуля
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # эмодзи: смайлики
+    "\U0001F300-\U0001F5FF"  # эмодзи: разные символы и пиктограммы
+    "\U0001F680-\U0001F6FF"  # эмодзи: транспорт и символы
+    "\U0001F700-\U0001F77F"  # эмодзи: алхимические символы
+    "\U0001F780-\U0001F7FF"  # эмодзи: геометрические фигуры
+    "\U0001F800-\U0001F8FF"  # эмодзи: дополнительные стрелки
+    "\U0001F900-\U0001F9FF"  # эмодзи: дополнительные символы
+    "\U0001FA00-\U0001FA6F"  # эмодзи: расширенные символы
+    "\U0001FA70-\U0001FAFF"  # эмодзи: символы
+    "\U00002702-\U000027B0"  # эмодзи: разные символы
+    "\U000024C2-\U0001F251"  # эмодзи: заключенные символы
+    "\u200d"                 # соединитель нулевой ширины (ZWJ)
+    "]+", flags=re.UNICODE
+)
+_QUOTES_PATTERN = re.compile(r"[«»„“”]")
+_DASHES_PATTERN = re.compile(r"\s+[–—-]+\s+")
+_REPEATED_PUNCT_PATTERN = re.compile(r"([!?,;:])\1+")
+_ELLIPSIS_PATTERN = re.compile(r"\.{2,}|…")
+_SPACE_BEFORE_PUNCT_PATTERN = re.compile(r"\s+([.,!?;:])")
+_MISSING_SPACE_PATTERN = re.compile(r"([,!?;:](?=[A-Za-zА-Яа-яЁё])|\.(?=[A-ZА-ЯЁ]))")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Простое число Мерсенна для универсального хеширования MinHash
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+CATEGORIES = ("advantages", "disadvantages", "comments")
+
+# Слова, меняющие смысл отзыва на противоположный при почти том же тексте
+NEGATIONS = frozenset({"не", "нет", "без", "ни"})
+
+
+def strip_emoji(text):
+    """Удаление эмодзи предкомпилированным шаблоном"""
+    if not text:
+        return ""
+    return EMOJI_PATTERN.sub("", text)
+
+
+def normalize_text(text):
+    """
+    Нормализация одного отзыва: эмодзи, пробелы и пунктуация
+
+    Args:
+        text (str): Исходный текст отзыва
+
+    Returns:
+        str: Очищенный текст (пустая строка, если текста не осталось)
+    """
+    if not text:
+        return ""
+
+    text = strip_emoji(text)
+    text = _QUOTES_PATTERN.sub('"', text)
+    text = _DASHES_PATTERN.sub(" - ", text)
+    text = _ELLIPSIS_PATTERN.sub("...", text)
+    text = _REPEATED_PUNCT_PATTERN.sub(r"\1", text)
+    text = _WHITESPACE_PATTERN.sub(" ", text)
+    text = _SPACE_BEFORE_PUNCT_PATTERN.sub(r"\1", text)
+    text = _MISSING_SPACE_PATTERN.sub(r"\1 ", text)
+    text = text.strip(" -,;:")
+
+    # Отзыв без единой буквы или цифры не несет информации для моделей
+    if not _WORD_PATTERN.search(text):
+        return ""
+    return text
+
+
+class ReviewNormalizer:
+    """Нормализация отзывов и схлопывание дубликатов через MinHash/LSH"""
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=5, seed=1):
+        """
+        Args:
+            threshold (float): Порог оценки сходства Жаккара для объединения отзывов
+            num_perm (int): Количество хеш-функций MinHash
+            bands (int): Количество полос LSH (num_perm должно делиться на bands)
+            shingle_size (int): Длина символьного шингла
+            seed (int): Зерно для детерминированных коэффициентов хеширования
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands без остатка")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def _shingles(self, text):
+        """Множество хешей символьных шинглов для текста"""
+        key = " ".join(_WORD_PATTERN.findall(text.lower()))
+        if len(key) <= self.shingle_size:
+            return {zlib.crc32(key.encode("utf-8"))}
+        return {
+            zlib.crc32(key[i:i + self.shingle_size].encode("utf-8"))
+            for i in range(len(key) - self.shingle_size + 1)
+        }
+
+    def _words(self, text):
+        """Множество слов текста в нижнем регистре"""
+        return set(_WORD_PATTERN.findall(text.lower()))
+
+    def _signature(self, shingles):
+        """MinHash-сигнатура множества шинглов"""
+        return tuple(
+            min(((a * s + b) % _MERSENNE_PRIME) & _MAX_HASH for s in shingles)
+            for a, b in self._perms
+        )
+
+    def _similarity(self, sig_a, sig_b):
+        """Оценка сходства Жаккара по двум сигнатурам"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / self.num_perm
+
+    def collapse(self, reviews):
+        """
+        Нормализация списка отзывов и объединение почти одинаковых
+
+        Args:
+            reviews (list): Список исходных текстов отзывов
+
+        Returns:
+            list: Кластеры вида {"text": str, "count": int} в порядке первого появления;
+                представитель кластера - самый частый из его вариантов
+        """
+        clusters = []
+        signatures = []
+        words = []  # слова первого отзыва кластера, по которому построена сигнатура
+        variants = []  # для каждого кластера: вариант текста -> количество
+        buckets = {}
+        exact = {}
+
+        for review in reviews:
+            text = normalize_text(review)
+            if not text:
+                continue
+
+            # Точные дубликаты отсекаем без вычисления сигнатуры
+            exact_key = text.lower()
+            if exact_key in exact:
+                self._add_variant(clusters, variants, exact[exact_key], text)
+                continue
+
+            signature = self._signature(self._shingles(text))
+            band_keys = [
+                (band, signature[band * self.rows:(band + 1) * self.rows])
+                for band in range(self.bands)
+            ]
+
+            # Кандидаты - отзывы, совпавшие хотя бы в одной полосе LSH
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(buckets.get(band_key, ()))
+
+            text_words = self._words(text)
+            match = None
+            best = self.threshold
+            for idx in sorted(candidates):
+                similarity = self._similarity(signature, signatures[idx])
+                # Отрицание в различающихся словах меняет смысл: "подошел" и "не подошел" не объединяем
+                if similarity >= best and not (text_words ^ words[idx]) & NEGATIONS:
+                    match, best = idx, similarity
+
+            if match is not None:
+                self._add_variant(clusters, variants, match, text)
+                exact[exact_key] = match
+                continue
+
+            idx = len(clusters)
+            clusters.append({"text": text, "count": 1})
+            signatures.append(signature)
+            words.append(text_words)
+            variants.append({text: 1})
+            exact[exact_key] = idx
+            for band_key in band_keys:
+                buckets.setdefault(band_key, []).append(idx)
+
+        return clusters
+
+    @staticmethod
+    def _add_variant(clusters, variants, idx, text):
+        """Учет отзыва в кластере и выбор самого частого варианта представителем"""
+        clusters[idx]["count"] += 1
+        counts = variants[idx]
+        counts[text] = counts.get(text, 0) + 1
+        # При равенстве остается вариант, встретившийся раньше
+        if counts[text] > counts[clusters[idx]["text"]]:
+            clusters[idx]["text"] = text
+
+    def normalize_reviews(self, reviews_data):
+        """
+        Нормализация всех категорий отзывов
+
+        Args:
+            reviews_data (dict): Списки отзывов по категориям
+
+        Returns:
+            dict: Кластеры отзывов по категориям
+        """
+        result = {}
+        for category in CATEGORIES:
+            reviews = reviews_data.get(category, [])
+            result[category] = self.collapse(reviews)
+            logger.info(
+                f"Нормализация {category}: {len(reviews)} отзывов -> {len(result[category])} уникальных"
+            )
+        return result
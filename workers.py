@@ -0,0 +1,387 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import collections
+import multiprocessing
+from multiprocessing.connection import wait
+from rate_limiter import rate_limiter
+from log_setup import setup_worker_logging, log_queue, request_id
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Размер страницы памяти для пересчета /proc/<pid>/statm в байты
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class WorkerCrashed(Exception):
+    """Процесс-обработчик завершился во время выполнения задачи"""
+
+
+def rss_bytes(pid):
+    """Текущий резидентный объем памяти процесса (None, если недоступно)"""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def _run_job(kind, payload, deadline=None):
+    """Выполнение одной задачи внутри процесса-обработчика"""
+    if kind == "parse":
+        from parser_async import WildberriesParser
+        # Задача - артикул или пара (артикул, ключи отзывов с готовым результатом)
+        article, known_keys = payload if isinstance(payload, tuple) else (payload, None)
+        return await WildberriesParser().parse(article, deadline=deadline, known_keys=known_keys)
+
+    if kind == "analyze":
+        from analyzer_async import Analyzer
+        csv_path, analyzed_data = await Analyzer().analyze_reviews_data_async(payload, deadline=deadline)
+        return {"csv_path": csv_path, "analyzed_data": analyzed_data}
+
+    if kind == "parse_many":
+        from parser_async import WildberriesParser
+        return await WildberriesParser.parse_many(payload, deadline=deadline)
+
+    if kind == "analyze_many":
+        from analyzer_async import Analyzer
+        results = await Analyzer().analyze_many_async(payload, deadline=deadline)
+        return [{"csv_path": csv_path, "analyzed_data": analyzed_data} for csv_path, analyzed_data in results]
+
+    raise ValueError(f"Неизвестный тип задачи: {kind}")
+
+
+def _worker_main(worker_id, conn, max_rss, limiter_state, workers, queue):
+    """
+    Цикл процесса-обработчика: принимает задачи по каналу и возвращает результаты
+
+    Args:
+        worker_id (int): Номер слота обработчика
+        conn (multiprocessing.connection.Connection): Канал связи с фронтендом
+        max_rss (int): Порог памяти в байтах, после которого процесс перезапускается
+        limiter_state: Разделяемое состояние ограничителя запросов к маркетплейсу
+        workers (int): Количество процессов пула, делящих ядра
+        queue (multiprocessing.Queue): Очередь логов главного процесса
+    """
+    setup_worker_logging(queue)
+    rate_limiter.use_state(limiter_state)
+
+    # Потоки настраиваются до первого прогона моделей, прогрев - до первой задачи
+    from models.runtime import configure_threads
+    configure_threads(workers)
+    if os.getenv("MODEL_WARMUP", "1") == "1":
+        try:
+            from analyzer_async import Analyzer
+            Analyzer().warm_up()
+        except Exception as e:
+            # Без прогрева обработчик работает, первая задача просто будет медленнее
+            logger.error(f"Обработчик {worker_id}: прогрев моделей не выполнен: {e}")
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    logger.info(f"Обработчик {worker_id} запущен (pid {os.getpid()})")
+
+    stopping = False
+    while not stopping:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        if job[0] == "cancel":
+            continue  # Отмена пришла, когда задача уже завершилась
+
+        job_id, kind, payload, deadline, job_request_id = job
+        # Задача создается после установки и получает идентификатор запроса в свой контекст
+        request_id.set(job_request_id)
+        # Жесткая граница: этапы сами укладываются в срок, это страховка от зависаний
+        task = loop.create_task(asyncio.wait_for(
+            _run_job(kind, payload, deadline),
+            timeout=deadline.remaining() + 5 if deadline else None
+        ))
+
+        def on_message():
+            """Сообщения фронтенда во время выполнения задачи"""
+            nonlocal stopping
+            try:
+                message = conn.recv()
+            except EOFError:
+                stopping = True
+                task.cancel()
+                return
+            if message is None:
+                stopping = True  # Текущую задачу доделываем, затем выходим
+            elif message == ("cancel", job_id):
+                task.cancel()
+
+        loop.add_reader(conn.fileno(), on_message)
+        try:
+            result = loop.run_until_complete(task)
+            conn.send(("done", job_id, result))
+        except asyncio.CancelledError:
+            logger.info(f"Обработчик {worker_id}: задача {kind} отменена")
+            conn.send(("error", job_id, "Задача отменена"))
+        except asyncio.TimeoutError:
+            logger.warning(f"Обработчик {worker_id}: задача {kind} не уложилась в срок")
+            conn.send(("error", job_id, "Истек срок обработки запроса"))
+        except Exception as e:
+            logger.error(f"Обработчик {worker_id}: ошибка задачи {kind}: {e}", exc_info=True)
+            conn.send(("error", job_id, str(e)))
+        finally:
+            loop.remove_reader(conn.fileno())
+
+        # Процесс с раздувшейся памятью завершается сам, супервизор его заменит
+        rss = rss_bytes(os.getpid())
+        if max_rss and rss and rss > max_rss:
+            logger.warning(
+                f"Обработчик {worker_id} использует {rss // 2**20} МБ, перезапуск"
+            )
+            break
+
+    loop.close()
+
+
+class _Slot:
+    """Состояние одного процесса-обработчика на стороне фронтенда"""
+
+    def __init__(self):
+        self.process = None
+        self.conn = None
+        self.job_id = None
+        self.started_at = 0.0
+        self.backoff = 0.0
+        self.respawn_at = None
+
+
+class WorkerPool:
+    """Пул процессов парсинга и анализа с супервизором"""
+
+    def __init__(self, workers=2, max_rss_mb=4096, job_timeout=900, check_interval=1.0):
+        """
+        Args:
+            workers (int): Количество процессов-обработчиков
+            max_rss_mb (int): Порог памяти процесса в МБ для перезапуска
+            job_timeout (float): Максимальное время ожидания задачи в секундах
+            check_interval (float): Период проверки процессов супервизором
+        """
+        self.workers = workers
+        self.max_rss = max_rss_mb * 2**20
+        self.job_timeout = job_timeout
+        self.check_interval = check_interval
+
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = [_Slot() for _ in range(workers)]
+        self._pending = collections.deque()
+        self._jobs = {}  # job_id -> (kind, payload, deadline, request_id)
+        self._futures = {}
+        self._ids = itertools.count(1)
+        self._loop = None
+        self._reader = None
+        self._supervisor = None
+        self._stopping = False
+
+    def _spawn(self, worker_id):
+        """Запуск процесса-обработчика в слоте"""
+        slot = self._slots[worker_id]
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, child_conn, self.max_rss, rate_limiter.state, self.workers, log_queue()),
+            name=f"reviews-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+
+        slot.process = process
+        slot.conn = parent_conn
+        slot.job_id = None
+        slot.started_at = time.monotonic()
+        slot.respawn_at = None
+        logger.info(f"Запущен обработчик {worker_id} (pid {process.pid})")
+
+    def _assign(self):
+        """Раздача ожидающих задач свободным процессам"""
+        for slot in self._slots:
+            if not self._pending:
+                return
+            if slot.job_id is not None or slot.respawn_at is not None or not slot.process.is_alive():
+                continue
+
+            job_id = self._pending.popleft()
+            if job_id not in self._futures:
+                continue  # Ожидающая сторона уже отказалась от задачи
+            kind, payload, deadline, job_request_id = self._jobs.pop(job_id)
+            slot.job_id = job_id
+            try:
+                slot.conn.send((job_id, kind, payload, deadline, job_request_id))
+            except (OSError, ValueError):
+                # Процесс умер между проверкой и отправкой, вернем задачу в очередь
+                slot.job_id = None
+                self._jobs[job_id] = (kind, payload, deadline, job_request_id)
+                self._pending.appendleft(job_id)
+
+    def _read_results(self):
+        """Поток чтения результатов из процессов в event loop"""
+        while not self._stopping:
+            conns = {slot.conn: worker_id for worker_id, slot in enumerate(self._slots) if slot.conn}
+            try:
+                ready = wait(list(conns), timeout=0.5)
+            except OSError:
+                continue  # Канал закрыт супервизором во время ожидания
+            for conn in ready:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    # Процесс завершился: закрываем канал и убираем его из ожидания,
+                    # иначе wait() возвращал бы его снова и снова. Перезапуском займется супервизор
+                    slot = self._slots[conns[conn]]
+                    if slot.conn is conn:
+                        slot.conn = None
+                    conn.close()
+                    continue
+                self._loop.call_soon_threadsafe(self._dispatch, conns[conn], message)
+
+    def _dispatch(self, worker_id, message):
+        """Передача результата ожидающей задаче"""
+        status, job_id, value = message
+        slot = self._slots[worker_id]
+        if slot.job_id == job_id:
+            slot.job_id = None
+
+        future = self._futures.pop(job_id, None)
+        if future is not None and not future.done():
+            if status == "done":
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+        self._assign()
+
+    def _fail_job(self, job_id, worker_id):
+        """Завершение задачи ошибкой, если процесс упал, не вернув результат"""
+        future = self._futures.pop(job_id, None)
+        if future and not future.done():
+            future.set_exception(WorkerCrashed(f"Обработчик {worker_id} аварийно завершился"))
+
+    async def _supervise(self):
+        """Перезапуск упавших и раздувшихся процессов"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for worker_id, slot in enumerate(self._slots):
+                if slot.respawn_at is not None:
+                    if time.monotonic() >= slot.respawn_at:
+                        self._spawn(worker_id)
+                        self._assign()
+                    continue
+
+                process = slot.process
+                if process.is_alive():
+                    # Жесткий предел на случай, если процесс раздулся посреди задачи
+                    rss = rss_bytes(process.pid)
+                    if not (rss and rss > self.max_rss * 1.5):
+                        continue
+                    logger.warning(
+                        f"Обработчик {worker_id} превысил предел памяти ({rss // 2**20} МБ), остановка"
+                    )
+                    process.kill()
+                    await asyncio.to_thread(process.join, 5)
+
+                logger.warning(f"Обработчик {worker_id} завершился с кодом {process.exitcode}")
+                if slot.job_id is not None:
+                    # Результат мог быть отправлен перед выходом и еще не прочитан
+                    self._loop.call_later(2.0, self._fail_job, slot.job_id, worker_id)
+                    slot.job_id = None
+                if slot.conn is not None:
+                    slot.conn.close()
+                    slot.conn = None
+
+                # Процесс, упавший вскоре после старта, перезапускаем с нарастающей задержкой
+                if time.monotonic() - slot.started_at < 30:
+                    slot.backoff = min(max(slot.backoff * 2, 1.0), 60.0)
+                else:
+                    slot.backoff = 0.0
+                slot.respawn_at = time.monotonic() + slot.backoff
+
+    async def start(self):
+        """Запуск процессов, потока чтения результатов и супервизора"""
+        self._loop = asyncio.get_running_loop()
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        self._reader = threading.Thread(target=self._read_results, name="reviews-results", daemon=True)
+        self._reader.start()
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    def _cancel(self, job_id):
+        """Отмена задачи, уже переданной процессу"""
+        for slot in self._slots:
+            if slot.job_id == job_id and slot.conn is not None:
+                try:
+                    slot.conn.send(("cancel", job_id))
+                except (OSError, ValueError):
+                    pass  # Процесс уже завершился, им займется супервизор
+                return
+
+    async def submit(self, kind, payload, deadline=None):
+        """
+        Отправка задачи в пул и ожидание результата
+
+        Args:
+            kind (str): Тип задачи (parse, analyze, parse_many, analyze_many)
+            payload: Данные задачи
+            deadline (Deadline): Крайний срок; этапы задачи укладываются в него
+
+        Returns:
+            Результат задачи
+
+        Raises:
+            asyncio.TimeoutError: Задача не завершилась вовремя и отменена
+        """
+        job_id = next(self._ids)
+        future = self._loop.create_future()
+        self._futures[job_id] = future
+        self._jobs[job_id] = (kind, payload, deadline, request_id.get())
+        self._pending.append(job_id)
+        self._assign()
+        timeout = self.job_timeout
+        if deadline is not None:
+            # Запас на ответ обработчика, который сам следит за сроком
+            timeout = min(timeout, deadline.remaining() + 10)
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # Запрос отменен или просрочен: освобождаем обработчик для других задач
+            self._cancel(job_id)
+            raise
+        finally:
+            self._futures.pop(job_id, None)
+            self._jobs.pop(job_id, None)
+
+    async def stop(self):
+        """Остановка процессов и вспомогательных задач"""
+        if self._supervisor:
+            self._supervisor.cancel()
+        self._stopping = True
+        for slot in self._slots:
+            if slot.conn is not None:
+                try:
+                    slot.conn.send(None)
+                except (OSError, ValueError):
+                    pass
+        for slot in self._slots:
+            if slot.process is None:
+                continue
+            await asyncio.to_thread(slot.process.join, 10)
+            if slot.process.is_alive():
+                slot.process.kill()
+        if self._reader:
+            await asyncio.to_thread(self._reader.join, 1)
+        for slot in self._slots:
+            if slot.conn is not None:
+                slot.conn.close()
+                slot.conn = None
+        logger.info("Пул обработчиков остановлен")